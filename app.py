@@ -1,26 +1,30 @@
 import os
+import sys
 import uuid
 import shutil
 import io
+import gc
+import hashlib
+import json
+import time
 import zipfile
-from flask import Flask, render_template, request, send_file, jsonify
+import tempfile
+import importlib
+import itertools
+import threading
+import queue
+import multiprocessing
+from collections import OrderedDict
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, Request, Response, render_template, request, send_file, jsonify, stream_with_context
 from werkzeug.utils import secure_filename
 
-# --- PDF Libraries ---
-from pypdf import PdfReader, PdfWriter
-from pdf2docx import Converter as Pdf2DocxConverter
-import img2pdf
-
-# --- Image Library ---
-from PIL import Image
-
-# --- Document Libraries ---
-from docx import Document
-from pptx import Presentation
-from openpyxl import load_workbook # Replaces pandas
-from xhtml2pdf import pisa
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
+# PDF / document libraries (pypdf, pdf2docx, img2pdf, PIL, python-docx,
+# python-pptx, openpyxl, xhtml2pdf, reportlab) are NOT imported here.
+# Each tool lists its 'deps' in TOOLS and they are loaded on first use,
+# so a cold start for '/' or '/tool/<slug>' stays cheap.
 
 app = Flask(__name__)
 
@@ -31,23 +35,269 @@ app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
 
 # --- 1. TOOL DEFINITIONS ---
 TOOLS = {
-    'merge-pdf': {'name': 'Merge PDF', 'desc': 'Combine multiple PDFs.', 'accept': '.pdf', 'cat': 'basic'},
-    'split-pdf': {'name': 'Split PDF', 'desc': 'Separate pages into ZIP.', 'accept': '.pdf', 'cat': 'basic'},
-    'compress-pdf': {'name': 'Compress PDF', 'desc': 'Reduce PDF size.', 'accept': '.pdf', 'cat': 'basic'},
-    'jpg-to-pdf': {'name': 'JPG to PDF', 'desc': 'Convert Images to PDF.', 'accept': '.jpg,.jpeg,.png', 'cat': 'to-pdf'},
-    'word-to-pdf': {'name': 'Word to PDF', 'desc': 'DOCX text to PDF.', 'accept': '.docx', 'cat': 'to-pdf'},
-    'ppt-to-pdf': {'name': 'PowerPoint to PDF', 'desc': 'PPTX slides to PDF.', 'accept': '.pptx', 'cat': 'to-pdf'},
-    'excel-to-pdf': {'name': 'Excel to PDF', 'desc': 'XLSX to PDF.', 'accept': '.xlsx', 'cat': 'to-pdf'},
-    'html-to-pdf': {'name': 'HTML to PDF', 'desc': 'HTML to PDF.', 'accept': '.html', 'cat': 'to-pdf'},
-    'pdf-to-word': {'name': 'PDF to Word', 'desc': 'PDF to DOCX.', 'accept': '.pdf', 'cat': 'from-pdf'},
-    'pdf-to-txt': {'name': 'PDF to Text', 'desc': 'Extract plain text.', 'accept': '.pdf', 'cat': 'from-pdf'},
-    'remove-pages': {'name': 'Remove Pages', 'desc': 'Remove 1st page.', 'accept': '.pdf', 'cat': 'organize'},
-    'extract-pages': {'name': 'Extract Pages', 'desc': 'Extract 1st page.', 'accept': '.pdf', 'cat': 'organize'},
-    'rotate-pdf': {'name': 'Rotate PDF', 'desc': 'Rotate 90 degrees.', 'accept': '.pdf', 'cat': 'edit'},
-    'protect-pdf': {'name': 'Protect PDF', 'desc': 'Add Password.', 'accept': '.pdf', 'cat': 'security', 'inputs': ['password']},
-    'unlock-pdf': {'name': 'Unlock PDF', 'desc': 'Remove Password.', 'accept': '.pdf', 'cat': 'security', 'inputs': ['password']},
+    'merge-pdf': {'name': 'Merge PDF', 'desc': 'Combine multiple PDFs.', 'accept': '.pdf', 'cat': 'basic', 'inputs': ['spec'], 'deps': ['pypdf']},
+    'split-pdf': {'name': 'Split PDF', 'desc': 'Separate pages into ZIP.', 'accept': '.pdf', 'cat': 'basic', 'inputs': ['ranges', 'chunk_size'], 'deps': ['pypdf']},
+    'compress-pdf': {'name': 'Compress PDF', 'desc': 'Reduce PDF size.', 'accept': '.pdf', 'cat': 'basic', 'inputs': ['preset'], 'deps': ['pypdf', 'PIL.Image']},
+    'jpg-to-pdf': {'name': 'JPG to PDF', 'desc': 'Convert Images to PDF.', 'accept': '.jpg,.jpeg,.png', 'cat': 'to-pdf', 'deps': ['img2pdf']},
+    'word-to-pdf': {'name': 'Word to PDF', 'desc': 'DOCX text to PDF.', 'accept': '.docx', 'cat': 'to-pdf', 'deps': ['docx', 'docx.enum.style', 'docx.table', 'docx.text.paragraph', 'docx.text.run', 'reportlab.platypus', 'reportlab.lib.styles', 'xml.sax.saxutils', 'PIL.Image']},
+    'ppt-to-pdf': {'name': 'PowerPoint to PDF', 'desc': 'PPTX slides to PDF.', 'accept': '.pptx', 'cat': 'to-pdf', 'deps': ['pptx', 'reportlab.pdfgen.canvas', 'pypdf']},
+    'excel-to-pdf': {'name': 'Excel to PDF', 'desc': 'XLSX to PDF.', 'accept': '.xlsx', 'cat': 'to-pdf', 'async': True, 'inputs': ['header_rows'], 'deps': ['openpyxl', 'openpyxl.utils', 'reportlab.pdfgen.canvas', 'reportlab.lib.pagesizes', 'pypdf']},
+    'html-to-pdf': {'name': 'HTML to PDF', 'desc': 'HTML to PDF.', 'accept': '.html', 'cat': 'to-pdf', 'deps': ['xhtml2pdf.pisa']},
+    'pdf-to-word': {'name': 'PDF to Word', 'desc': 'PDF to DOCX.', 'accept': '.pdf', 'cat': 'from-pdf', 'async': True, 'deps': ['pdf2docx', 'fitz', 'cv2']},
+    'pdf-to-txt': {'name': 'PDF to Text', 'desc': 'Extract plain text.', 'accept': '.pdf', 'cat': 'from-pdf', 'inputs': ['orientation', 'separator'], 'deps': ['pypdf']},
+    'pdf-to-json': {'name': 'PDF to JSON', 'desc': 'Page-by-page text as NDJSON.', 'accept': '.pdf', 'cat': 'from-pdf', 'inputs': ['orientation', 'positions'], 'deps': ['pypdf']},
+    'remove-pages': {'name': 'Remove Pages', 'desc': 'Remove selected pages.', 'accept': '.pdf', 'cat': 'organize', 'inputs': ['pages'], 'deps': ['pypdf']},
+    'extract-pages': {'name': 'Extract Pages', 'desc': 'Extract selected pages.', 'accept': '.pdf', 'cat': 'organize', 'inputs': ['pages'], 'deps': ['pypdf']},
+    'rotate-pdf': {'name': 'Rotate PDF', 'desc': 'Rotate selected pages.', 'accept': '.pdf', 'cat': 'edit', 'inputs': ['pages', 'angle'], 'deps': ['pypdf']},
+    'protect-pdf': {'name': 'Protect PDF', 'desc': 'Add Password.', 'accept': '.pdf', 'cat': 'security', 'inputs': ['password'], 'deps': ['pypdf']},
+    'unlock-pdf': {'name': 'Unlock PDF', 'desc': 'Remove Password.', 'accept': '.pdf', 'cat': 'security', 'inputs': ['password'], 'deps': ['pypdf']},
+}
+
+# Extra form fields a tool can ask for via its 'inputs' list.
+INPUT_FIELDS = {
+    'password': {'type': 'password', 'placeholder': 'Password (Optional)'},
+    'ranges': {'type': 'text', 'placeholder': 'Page ranges, e.g. 1-10,11-20 (Optional)'},
+    'chunk_size': {'type': 'number', 'placeholder': 'Pages per file (Optional)'},
+    'preset': {'type': 'select', 'choices': ['ebook', 'screen', 'printer']},
+    'header_rows': {'type': 'number', 'placeholder': 'Header rows repeated on every page (default 1)'},
+    'pages': {'type': 'text', 'placeholder': 'Pages, e.g. 1-3,7,odd,even,last-2 (Optional)'},
+    'angle': {'type': 'select', 'choices': ['90', '180', '270']},
+    'orientation': {'type': 'select', 'choices': ['all', 'upright']},
+    'positions': {'type': 'select', 'choices': ['no', 'yes']},
+    'separator': {'type': 'text', 'placeholder': 'Text between pages, e.g. \\f (default: blank line)'},
+    'spec': {'type': 'text', 'placeholder': 'Order and pages, e.g. [{"file": 1, "pages": "1-3", "bookmark": "Intro"}, {"file": 0}] (Optional)'},
 }
 
+# --- LAZY IMPORTS ---
+_MODULES = {}
+IMPORT_TIMINGS = {}       # module name -> seconds spent importing it
+TOOL_IMPORT_TIMINGS = {}  # slug -> import cost paid on the tool's first use
+
+def lib(name):
+    module = _MODULES.get(name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        IMPORT_TIMINGS[name] = round(time.perf_counter() - start, 4)
+        _MODULES[name] = module
+    return module
+
+def load_tool_deps(slug):
+    if slug in TOOL_IMPORT_TIMINGS:
+        return
+    deps = TOOLS[slug].get('deps', [])
+    start = time.perf_counter()
+    for name in deps:
+        lib(name)
+    TOOL_IMPORT_TIMINGS[slug] = {
+        'seconds': round(time.perf_counter() - start, 4),
+        'modules': {name: IMPORT_TIMINGS.get(name, 0.0) for name in deps},
+    }
+
+# --- UPLOADS ---
+# Uploads stay in memory up to SPOOL_THRESHOLD bytes before rolling over to
+# an anonymous temp file. Converters read the upload stream directly; only
+# libraries that insist on a filename make an UploadInput spill to disk.
+SPOOL_THRESHOLD = int(os.environ.get('SPOOL_THRESHOLD', 8 * 1024 * 1024))
+
+class HashingSpool(tempfile.SpooledTemporaryFile):
+    # Hashes the upload while Werkzeug writes it, so the digest is ready
+    # before anything reads the file back.
+    def __init__(self, max_size):
+        super().__init__(max_size=max_size)
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return super().write(data)
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpool(SPOOL_THRESHOLD)
+
+app.request_class = UploadRequest
+
+class UploadInput:
+    def __init__(self, name, folder, stream=None, path=None, digest=None):
+        self.name = name
+        self.folder = folder
+        self._stream = stream
+        self._path = path
+        self._digest = digest
+
+    @classmethod
+    def from_storage(cls, storage, folder):
+        stream = storage.stream
+        digest = stream.sha256.hexdigest() if isinstance(stream, HashingSpool) else None
+        return cls(secure_filename(storage.filename), folder, stream=stream, digest=digest)
+
+    def open(self):
+        if self._stream is None:
+            self._stream = open(self._path, 'rb')
+        self._stream.seek(0)
+        return self._stream
+
+    def read(self):
+        return self.open().read()
+
+    @property
+    def size(self):
+        stream = self.open()
+        stream.seek(0, os.SEEK_END)
+        return stream.tell()
+
+    @property
+    def path(self):
+        if self._path is None:
+            # Uploads can share a name (two scan.pdf from different folders),
+            # so each spill gets its own prefix.
+            self._path = os.path.join(self.folder, f"in_{uuid.uuid4().hex[:8]}_{self.name}")
+            with open(self._path, 'wb') as f:
+                shutil.copyfileobj(self.open(), f)
+        return self._path
+
+    @property
+    def digest(self):
+        if self._digest is None:
+            h = hashlib.sha256()
+            stream = self.open()
+            for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                h.update(chunk)
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def detach(self):
+        # Werkzeug closes upload streams when the request ends; keep a copy
+        # for work that outlives it (async jobs).
+        if self._path is None and self.size <= SPOOL_THRESHOLD:
+            self._stream = io.BytesIO(self.read())
+        else:
+            self.path
+            self._stream = None
+
+    def __getstate__(self):
+        # Worker processes get small uploads as bytes and large ones by path.
+        state = {'name': self.name, 'folder': self.folder, 'digest': self._digest}
+        if self._path is None and self.size <= SPOOL_THRESHOLD:
+            state['data'] = self.read()
+        else:
+            state['path'] = self.path
+        return state
+
+    def __setstate__(self, state):
+        self.name = state['name']
+        self.folder = state['folder']
+        self._path = state.get('path')
+        self._stream = io.BytesIO(state['data']) if 'data' in state else None
+        self._digest = state['digest']
+
+# --- SESSIONS ---
+# Every request works in SESSION_DIR/<session_id>. Finished sessions expire
+# SESSION_TTL seconds after their output was written, the oldest of them are
+# evicted once all of them together hold more than SESSION_QUOTA bytes, and
+# a download removes its session. Sessions still in use are only swept once
+# they are SESSION_MAX_AGE seconds old, as a backstop for any path that
+# forgets to commit or remove them.
+SESSION_DIR = os.environ.get('SESSION_DIR', os.path.join(UPLOAD_FOLDER, 'pdf-sessions'))
+SESSION_TTL = int(os.environ.get('SESSION_TTL', 900))
+SESSION_MAX_AGE = int(os.environ.get('SESSION_MAX_AGE', 6 * 3600))
+SESSION_QUOTA = int(os.environ.get('SESSION_QUOTA', 256 * 1024 * 1024))
+SWEEP_INTERVAL = int(os.environ.get('SWEEP_INTERVAL', 60))
+
+class SessionStore:
+    def __init__(self, root, ttl, quota, max_age):
+        self.root = root
+        self.ttl = ttl
+        self.max_age = max_age
+        self.quota = quota
+        self.sessions = {}  # session_id -> {'created', 'committed', 'bytes'}; the last two None while in use
+        self.evicted = 0
+        self.lock = threading.Lock()
+        self.sweeper = None
+
+    def folder(self, session_id):
+        # Normalising through UUID() rejects anything that could escape root.
+        return os.path.join(self.root, str(uuid.UUID(session_id)))
+
+    def create(self):
+        session_id = str(uuid.uuid4())
+        os.makedirs(self.folder(session_id), exist_ok=True)
+        with self.lock:
+            self.sessions[session_id] = {'created': time.time(), 'committed': None, 'bytes': None}
+            if self.sweeper is None:
+                # Started on first use, not at import, so worker processes don't run one.
+                self.sweeper = threading.Thread(target=self._sweep_loop, daemon=True)
+                self.sweeper.start()
+        return session_id
+
+    def commit(self, session_id):
+        # Called once a session's output is written; it becomes evictable.
+        folder = self.folder(session_id)
+        size = sum(e.stat().st_size for e in os.scandir(folder) if e.is_file()) if os.path.isdir(folder) else 0
+        with self.lock:
+            if session_id in self.sessions:
+                self.sessions[session_id].update(committed=time.time(), bytes=size)
+            finished = sorted((r['committed'], sid) for sid, r in self.sessions.items()
+                              if r['bytes'] is not None and sid != session_id)
+            total = sum(r['bytes'] for r in self.sessions.values() if r['bytes'] is not None)
+            victims = []
+            while total > self.quota and finished:
+                _, sid = finished.pop(0)
+                total -= self.sessions[sid]['bytes']
+                victims.append(sid)
+            self.evicted += len(victims)
+        for sid in victims:
+            self.remove(sid)
+
+    def remove(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+        shutil.rmtree(self.folder(session_id), ignore_errors=True)
+
+    def sweep(self):
+        now = time.time()
+        cutoff = now - self.ttl
+        with self.lock:
+            expired = [sid for sid, r in self.sessions.items()
+                       if (r['committed'] or now) < cutoff or r['created'] < now - self.max_age]
+        if not os.path.isdir(self.root):
+            return len(expired)
+        # Also catch folders left behind by other workers or a previous process.
+        for entry in os.scandir(self.root):
+            try:
+                uuid.UUID(entry.name)
+            except ValueError:
+                continue
+            if entry.is_dir() and entry.name not in self.sessions and entry.stat().st_mtime < cutoff:
+                expired.append(entry.name)
+        for sid in expired:
+            self.remove(sid)
+        return len(expired)
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(SWEEP_INTERVAL)
+            try:
+                self.sweep()
+                if RESULT_CACHE is not None:
+                    RESULT_CACHE.expire()
+            except OSError as e:
+                print(f"WARNING: session sweep failed: {e}")
+
+    def stats(self):
+        with self.lock:
+            held = [r['bytes'] for r in self.sessions.values() if r['bytes'] is not None]
+            return {
+                'sessions': len(self.sessions),
+                'active': len(self.sessions) - len(held),
+                'bytes': sum(held),
+                'quota': self.quota,
+                'ttl': self.ttl,
+                'evicted': self.evicted,
+            }
+
+SESSIONS = SessionStore(SESSION_DIR, SESSION_TTL, SESSION_QUOTA, SESSION_MAX_AGE)
+
 # --- STATIC PAGES ROUTES ---
 @app.route('/')
 def index():
@@ -75,160 +325,2006 @@ def tool_view(slug):
     if slug not in TOOLS:
         return render_template('404.html'), 404
     tool = TOOLS.get(slug)
-    return render_template('tool.html', tool=tool, slug=slug)
+    return render_template('tool.html', tool=tool, slug=slug, fields=INPUT_FIELDS)
 
 # --- HELPER FUNCTIONS ---
-def docx_to_pdf_content(input_path, output_path):
-    doc = Document(input_path)
-    c = canvas.Canvas(output_path, pagesize=letter)
-    text_obj = c.beginText(40, 750)
-    for para in doc.paragraphs:
-        if para.text.strip():
-            # Simple wrapping to prevent crash
-            text_obj.textLine(para.text.replace('\n', ' ')[:90])
-        if text_obj.getY() < 50:
+EMU_PER_POINT = 12700
+DOCX_ALIGN = {1: 1, 2: 2, 3: 4}  # WD_ALIGN_PARAGRAPH -> reportlab (4 = justify)
+DOCX_STYLES = {'Title': 'Title', 'Subtitle': 'Heading2', 'Heading 1': 'Heading1', 'Heading 2': 'Heading2',
+               'Heading 3': 'Heading3', 'Heading 4': 'Heading4', 'Heading 5': 'Heading5', 'Heading 6': 'Heading6'}
+
+@lru_cache(maxsize=1)
+def _sample_styles():
+    return lib('reportlab.lib.styles').getSampleStyleSheet()
+
+@lru_cache(maxsize=256)
+def docx_paragraph_style(style_name, alignment, bullet):
+    # Paragraph styles are built once per (Word style, alignment, bullet)
+    # rather than per paragraph.
+    base = _sample_styles()[DOCX_STYLES.get(style_name, 'Normal')]
+    return lib('reportlab.lib.styles').ParagraphStyle(
+        f"{style_name}/{alignment}/{bullet}", parent=base,
+        alignment=DOCX_ALIGN.get(alignment, 0), spaceAfter=base.spaceAfter or 4,
+        leftIndent=base.leftIndent + (12 if bullet else 0), bulletIndent=base.leftIndent)
+
+@lru_cache(maxsize=4096)
+def _run_markup(text, bold, italic, underline, size, color):
+    # Runs repeat a lot (table cells, headers, boilerplate), so their
+    # escaped Platypus markup is cached too.
+    markup = lib('xml.sax.saxutils').escape(text).replace('\n', '<br/>').replace('\t', '    ')
+    if bold:
+        markup = f"<b>{markup}</b>"
+    if italic:
+        markup = f"<i>{markup}</i>"
+    if underline:
+        markup = f"<u>{markup}</u>"
+    if size or color:
+        attrs = (f' size="{size}"' if size else '') + (f' color="#{color}"' if color else '')
+        markup = f"<font{attrs}>{markup}</font>"
+    return markup
+
+DOCX_WRAP_CACHE = 2048  # wrapped paragraphs kept by CachedParagraph
+
+@lru_cache(maxsize=1)
+def _cached_paragraph():
+    Paragraph = lib('reportlab.platypus').Paragraph
+
+    class CachedParagraph(Paragraph):
+        # Line breaking is most of the layout time, and documents repeat
+        # the same paragraph (table cells, labels, boilerplate) at the same
+        # width. Those share one wrapped result. Paragraphs Platypus splits
+        # across pages are built from fragments (text None) and not cached.
+        _lines = OrderedDict()
+
+        def breakLines(self, width):
+            if not self.text:
+                return super().breakLines(width)
+            key = (self.text, self.style.name, self.bulletText, tuple(width) if isinstance(width, list) else width)
+            lines = self._lines.get(key)
+            if lines is None:
+                lines = self._lines[key] = super().breakLines(width)
+                if len(self._lines) > DOCX_WRAP_CACHE:
+                    self._lines.popitem(last=False)
+            else:
+                self._lines.move_to_end(key)
+            return lines
+
+    return CachedParagraph
+
+def _docx_images(paragraph, max_width):
+    # Inline pictures of a paragraph as Image flowables, scaled to fit.
+    platypus = lib('reportlab.platypus')
+    images = []
+    for inline in paragraph._p.xpath('.//wp:inline | .//wp:anchor'):
+        blips = inline.xpath('.//a:blip/@r:embed')
+        extent = inline.xpath('./wp:extent')
+        if not blips or not extent:
+            continue
+        part = paragraph.part.related_parts.get(blips[0])
+        if part is None:
+            continue
+        width = int(extent[0].get('cx')) / EMU_PER_POINT
+        height = int(extent[0].get('cy')) / EMU_PER_POINT
+        if width > max_width:
+            width, height = max_width, height * max_width / width
+        try:
+            lib('PIL.Image').open(io.BytesIO(part.blob)).verify()
+        except Exception:
+            continue  # EMF/WMF and other formats Pillow cannot read
+        images.append(platypus.Image(io.BytesIO(part.blob), width=width, height=height))
+    return images
+
+# Runs of a paragraph in document order. paragraph.runs has only the direct
+# w:r children, which leaves out the text of hyperlinks, content controls,
+# tracked insertions and the like.
+DOCX_RUNS = ('./w:r | ./w:hyperlink/w:r | ./w:sdt/w:sdtContent//w:r | ./w:ins/w:r'
+             ' | ./w:smartTag/w:r | ./w:fldSimple/w:r')
+
+def _docx_runs(paragraph):
+    Run = lib('docx.text.run').Run
+    return [Run(r, paragraph) for r in paragraph._p.xpath(DOCX_RUNS)]
+
+def _docx_paragraph(paragraph, max_width, style_names):
+    platypus = lib('reportlab.platypus')
+    flowables = _docx_images(paragraph, max_width)
+    markup = ''.join(
+        _run_markup(run.text, bool(run.bold), bool(run.italic), bool(run.underline),
+                    run.font.size.pt if run.font.size else None,
+                    str(run.font.color.rgb) if run.font.color.type is not None and run.font.color.rgb else None)
+        for run in _docx_runs(paragraph) if run.text)
+    # paragraph.style searches the whole style table on every call
+    style_name = style_names.get(paragraph._p.style) or style_names[None]
+    bullet = style_name.startswith('List')
+    if markup.strip() or not flowables:
+        style = docx_paragraph_style(style_name, paragraph.alignment, bullet)
+        flowables.insert(0, _cached_paragraph()(markup or '&nbsp;', style, bulletText='\u2022' if bullet else None))
+    if paragraph._p.xpath('.//w:br[@w:type="page"]'):
+        flowables.append(platypus.PageBreak())
+    return flowables
+
+def _docx_table(table, max_width, style_names):
+    platypus = lib('reportlab.platypus')
+    widths = [column.width / EMU_PER_POINT if column.width else None for column in table.columns]
+    if None in widths or sum(widths) > max_width:
+        widths = [max_width / len(widths)] * len(widths)
+    data = []
+    for row in table.rows:
+        cells = []
+        for cell in row.cells[:len(widths)]:
+            content = []
+            for paragraph in cell.paragraphs:
+                content.extend(_docx_paragraph(paragraph, widths[len(cells)] - 6, style_names))
+            cells.append(content)
+        cells.extend([''] * (len(widths) - len(cells)))
+        data.append(cells)
+    if not data:
+        return []
+    grid = platypus.Table(data, colWidths=widths, repeatRows=0)
+    grid.setStyle(platypus.TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, lib('reportlab.lib.colors').grey),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ]))
+    return [grid, platypus.Spacer(1, 6)]
+
+def docx_to_pdf_content(input_file, output_path):
+    # Body paragraphs and tables in document order, laid out by Platypus on
+    # the first section's page size and margins. Runs keep bold, italic,
+    # underline, size and colour; inline pictures are placed before the
+    # text of their paragraph.
+    docx = lib('docx')
+    platypus = lib('reportlab.platypus')
+    doc = docx.Document(input_file)
+    section = doc.sections[0]
+    pt = lambda length, default: length / EMU_PER_POINT if length is not None else default
+    pagesize = (pt(section.page_width, 612), pt(section.page_height, 792))
+    margins = [pt(section.left_margin, 72), pt(section.right_margin, 72),
+               pt(section.top_margin, 72), pt(section.bottom_margin, 72)]
+    max_width = pagesize[0] - margins[0] - margins[1]
+    style_names = {style.style_id: style.name for style in doc.styles}
+    default = doc.styles.default(docx.enum.style.WD_STYLE_TYPE.PARAGRAPH)
+    style_names[None] = default.name if default is not None else 'Normal'
+    story = []
+    for child in doc.element.body.iterchildren():
+        tag = child.tag.rsplit('}', 1)[-1]
+        if tag == 'p':
+            story.extend(_docx_paragraph(docx.text.paragraph.Paragraph(child, doc), max_width, style_names))
+        elif tag == 'tbl':
+            story.extend(_docx_table(docx.table.Table(child, doc), max_width, style_names))
+    template = platypus.SimpleDocTemplate(output_path, pagesize=pagesize, leftMargin=margins[0], rightMargin=margins[1],
+                                          topMargin=margins[2], bottomMargin=margins[3])
+    template.build(story or [platypus.Spacer(1, 1)])
+    return template.page
+
+@lru_cache(maxsize=8192)
+def text_width(text, font, size):
+    return lib('reportlab.pdfbase.pdfmetrics').stringWidth(text, font, size)
+
+def fit_text(text, font, size, width):
+    # Longest prefix of text that fits in `width` points.
+    if text_width(text, font, size) <= width:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if lib('reportlab.pdfbase.pdfmetrics').stringWidth(text[:mid], font, size) <= width:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+def parse_page_ranges(expr, num_pages):
+    # "1-10,11-20,25,30-" -> one list of 0-based page indexes per range
+    groups = []
+    for part in expr.replace(' ', '').split(','):
+        if not part:
+            continue
+        start, sep, end = part.partition('-')
+        try:
+            first = int(start) if start else 1
+            last = (int(end) if end else num_pages) if sep else first
+        except ValueError:
+            raise ValueError(f"Invalid page range: {part}")
+        if first > last:
+            raise ValueError(f"Invalid page range: {part}")
+        if not 1 <= first <= last <= num_pages:
+            raise ValueError(f"Page range {part} is outside 1-{num_pages}")
+        groups.append(list(range(first - 1, last)))
+    if not groups:
+        raise ValueError('No pages selected')
+    return groups
+
+def parse_page_selection(expr, num_pages):
+    # "1-3,7,odd,last-2" -> sorted 0-based indexes of the selected pages.
+    # Numbers and ranges are as in parse_page_ranges; "last" is the final
+    # page and "last-N" the final N pages.
+    selected = set()
+    for part in expr.replace(' ', '').lower().split(','):
+        if part in ('odd', 'even'):
+            selected.update(range(0 if part == 'odd' else 1, num_pages, 2))
+        elif part == 'last':
+            selected.add(num_pages - 1)
+        elif part.startswith('last-'):
+            try:
+                count = int(part[5:])
+            except ValueError:
+                raise ValueError(f"Invalid page selection: {part}")
+            if not 1 <= count <= num_pages:
+                raise ValueError(f"Page selection {part} is outside 1-{num_pages}")
+            selected.update(range(num_pages - count, num_pages))
+        elif part:
+            for group in parse_page_ranges(part, num_pages):
+                selected.update(group)
+    if not selected:
+        raise ValueError('No pages selected')
+    return sorted(selected)
+
+def output_path(job, ext):
+    return os.path.join(job['folder'], f"{job['out_name']}{ext}")
+
+# --- 2. TOOL HANDLERS ---
+# Every slug in TOOLS maps to one handler. A handler takes a job dict
+# ({'slug', 'inputs', 'folder', 'out_name', 'options'}) and returns a dict
+# with the output 'path'; any other keys are passed through to the client.
+# The metadata tells the dispatcher how the handler may be run:
+#   streaming - has a streamer (see tool_streamer) that yields the output
+#               in chunks, so it can be sent while it is being produced
+#   parallel  - safe to run off the request thread, next to other jobs
+#   cpu_bound - mostly pure-Python work that holds the GIL
+#   memory    - 'low' | 'medium' | 'high' peak memory relative to the input
+#   fan_out   - farms pieces of the job out to the process pool itself
+#               (see fan_out_map)
+HANDLERS = {}
+
+def tool_handler(*slugs, parallel=False, cpu_bound=False, memory='low', fan_out=False):
+    def register(fn):
+        for slug in slugs:
+            HANDLERS[slug] = {'run': fn, 'streaming': False, 'parallel': parallel,
+                              'cpu_bound': cpu_bound, 'memory': memory, 'fan_out': fan_out}
+        return fn
+    return register
+
+def job_progress(job):
+    # Page-oriented handlers report as progress(done, total, bytes_written,
+    # unit); see ProgressReporter. Jobs nobody watches get a no-op.
+    return job.get('progress') or (lambda *args, **kwargs: None)
+
+def tool_streamer(slug, mimetype, ext):
+    def register(fn):
+        HANDLERS[slug].update(streaming=True, stream=fn, mimetype=mimetype, ext=ext)
+        return fn
+    return register
+
+class ZipSink:
+    # Write-only target for zipfile. It has no tell()/seek(), so zipfile
+    # writes data descriptors and the archive can be sent as it grows.
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+# merge-pdf switches to the streaming merger from this much total input. The
+# in-memory merge holds every input's object graph at once, a few times the
+# input size, so the default is a quarter of the upload limit.
+MERGE_STREAM_BYTES = int(os.environ.get('MERGE_STREAM_BYTES', app.config['MAX_CONTENT_LENGTH'] // 4))
+
+class StreamingMerger:
+    # Writes each appended input's objects to `out` as soon as it is added,
+    # so memory holds one input's object graph instead of every input's.
+    # The final page tree, info and catalog go out in close(). Outlines and
+    # form fields of the inputs are not carried over.
+    def __init__(self, out):
+        self.out = out
+        self.offsets = [None, None, None]  # objects 1-3: page tree, info, catalog
+        self.kids = []
+        self.outline = []  # (title, object number of the page it opens)
+        # Digest -> object number of every shareable object written so far;
+        # later copies point at the first one and are never written.
+        self.shared = {}
+        self.deduplicated = {'objects': 0, 'bytes': 0}
+        out.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write_object(self, obj):
+        self.offsets.append(self.out.tell())
+        self.out.write(f"{len(self.offsets)} 0 obj\n".encode())
+        obj.write_to_stream(self.out)
+        self.out.write(b"\nendobj\n")
+
+    def _dedupe(self, numbered, part):
+        # Same idea as dedupe_objects(), against the objects of earlier
+        # inputs as well. Only digests of final (fully remapped) objects are
+        # kept in self.shared, since a remap changes what an object hashes to.
+        dropped, local = set(), {}
+        while True:
+            local, mapping = {}, {}
+            for num, obj in numbered.items():
+                hashed = None if num in dropped else _dedupe_key(obj)
+                if hashed is None:
+                    continue
+                key, size = hashed
+                first = self.shared.get(key) or local.get(key)
+                if first:
+                    mapping[num] = first
+                    self.deduplicated['bytes'] += size
+                else:
+                    local[key] = num
+            if not mapping:
+                break
+            for num, obj in numbered.items():
+                if num not in dropped:
+                    _remap_refs(obj, mapping, part)
+            dropped.update(mapping)
+            self.deduplicated['objects'] += len(mapping)
+        self.shared.update(local)
+        return dropped
+
+    def append(self, reader, pages=None, bookmark=None):
+        # A scratch PdfWriter clones the pages and everything they use and
+        # numbers it 1..n; objects 1-3 are its own page tree, info and
+        # catalog, which line up with ours. The rest is renumbered after
+        # the objects already written.
+        part = lib('pypdf').PdfWriter()
+        part.append(reader, pages=pages, import_outline=False)
+        base = len(self.offsets) - 3
+        mapping = {idnum: idnum + base for idnum in range(4, len(part._objects) + 1)}
+        for obj in part._objects[3:]:
+            _remap_refs(obj, mapping, part)
+        kids = [mapping[page.indirect_reference.idnum] for page in part.pages]
+        if bookmark and kids:
+            self.outline.append((bookmark, kids[0]))
+        self.kids.extend(kids)
+        numbered = dict(zip(range(4 + base, len(part._objects) + 1 + base), part._objects[3:]))
+        dropped = self._dedupe(numbered, part)
+        for num, obj in numbered.items():
+            if num in dropped:
+                self.offsets.append(None)  # listed as a free xref entry
+            else:
+                self._write_object(obj)
+        return len(part.pages)
+
+    def _write_outline(self):
+        # Flat outline, one entry per bookmark, written after the page
+        # objects; returns the number of its root for the catalog.
+        generic = lib('pypdf').generic
+        ref = lambda idnum: generic.IndirectObject(idnum, 0, None)
+        root = len(self.offsets) + 1
+        items = list(range(root + 1, root + 1 + len(self.outline)))
+        self._write_object(generic.DictionaryObject({
+            generic.NameObject('/Type'): generic.NameObject('/Outlines'),
+            generic.NameObject('/First'): ref(items[0]),
+            generic.NameObject('/Last'): ref(items[-1]),
+            generic.NameObject('/Count'): generic.NumberObject(len(items)),
+        }))
+        for i, (title, page) in enumerate(self.outline):
+            item = generic.DictionaryObject({
+                generic.NameObject('/Title'): generic.create_string_object(title),
+                generic.NameObject('/Parent'): ref(root),
+                generic.NameObject('/Dest'): generic.ArrayObject([ref(page), generic.NameObject('/Fit')]),
+            })
+            if i:
+                item[generic.NameObject('/Prev')] = ref(items[i - 1])
+            if i + 1 < len(items):
+                item[generic.NameObject('/Next')] = ref(items[i + 1])
+            self._write_object(item)
+        return root
+
+    def close(self):
+        generic = lib('pypdf').generic
+        ref = lambda idnum: generic.IndirectObject(idnum, 0, None)
+        outlines = self._write_outline() if self.outline else None
+        objects = [
+            generic.DictionaryObject({
+                generic.NameObject('/Type'): generic.NameObject('/Pages'),
+                generic.NameObject('/Kids'): generic.ArrayObject(ref(k) for k in self.kids),
+                generic.NameObject('/Count'): generic.NumberObject(len(self.kids)),
+            }),
+            generic.DictionaryObject({
+                generic.NameObject('/Producer'): generic.create_string_object('pypdf'),
+            }),
+            generic.DictionaryObject({
+                generic.NameObject('/Type'): generic.NameObject('/Catalog'),
+                generic.NameObject('/Pages'): ref(1),
+            }),
+        ]
+        if outlines:
+            objects[2][generic.NameObject('/Outlines')] = ref(outlines)
+            objects[2][generic.NameObject('/PageMode')] = generic.NameObject('/UseOutlines')
+        for i, obj in enumerate(objects):
+            self.offsets[i] = self.out.tell()
+            self.out.write(f"{i + 1} 0 obj\n".encode())
+            obj.write_to_stream(self.out)
+            self.out.write(b"\nendobj\n")
+        xref = self.out.tell()
+        self.out.write(f"xref\n0 {len(self.offsets) + 1}\n".encode())
+        self.out.write(b"0000000000 65535 f \n")
+        for offset in self.offsets:
+            self.out.write(f"{offset:010d} 00000 n \n".encode() if offset is not None else b"0000000000 00000 f \n")
+        self.out.write(f"trailer\n<< /Size {len(self.offsets) + 1} /Root 3 0 R /Info 2 0 R >>\n".encode())
+        self.out.write(f"startxref\n{xref}\n%%EOF\n".encode())
+
+def merge_plan(job):
+    # [(input, page range expression, bookmark)] in output order. The
+    # optional 'spec' option is a JSON list such as
+    #   [{"file": 1, "pages": "1-3", "bookmark": "Intro"}, {"file": 0}]
+    # where file is the 0-based upload index and pages uses the split-pdf
+    # range syntax; without it every input is merged whole, in upload order.
+    inputs = job['inputs']
+    spec = job['options'].get('spec', '').strip()
+    if not spec:
+        return [(item, None, None) for item in inputs]
+    try:
+        entries = json.loads(spec)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"spec is not valid JSON: {e}")
+    if not isinstance(entries, list) or not entries:
+        raise ValueError('spec must be a non-empty JSON list')
+    plan = []
+    for entry in entries:
+        index = entry.get('file') if isinstance(entry, dict) else None
+        if not isinstance(index, int) or not 0 <= index < len(inputs):
+            raise ValueError(f"spec entry {entry!r} needs a file index between 0 and {len(inputs) - 1}")
+        pages, bookmark = entry.get('pages'), entry.get('bookmark')
+        if not isinstance(pages, (str, type(None))) or not isinstance(bookmark, (str, type(None))):
+            raise ValueError(f"spec entry {entry!r}: pages and bookmark must be strings")
+        plan.append((inputs[index], pages, bookmark))
+    return plan
+
+def plan_pages(reader, pages):
+    # Only the page tree is read to resolve the range; the selected pages'
+    # contents are the only ones cloned by append().
+    if not pages:
+        return None
+    return [i for group in parse_page_ranges(pages, len(reader.pages)) for i in group]
+
+def merge_streaming(job, out_path):
+    pypdf = lib('pypdf')
+    plan = merge_plan(job)
+    progress = job_progress(job)
+    with open(out_path, 'wb') as out:
+        merger = StreamingMerger(out)
+        for done, (item, pages, bookmark) in enumerate(plan, 1):
+            reader = pypdf.PdfReader(item.open())
+            merger.append(reader, plan_pages(reader, pages), bookmark)
+            progress(done, len(plan), out.tell(), 'files')
+            del reader
+            # pypdf objects point back at their reader, so the finished input
+            # is only freed by the cycle collector; don't wait for it.
+            gc.collect()
+        merger.close()
+    return merger.deduplicated
+
+def has_outline_or_form(item):
+    # Outlines and form fields are only carried over by the standard merge.
+    root = lib('pypdf').PdfReader(item.open()).trailer['/Root']
+    outlines = root.get('/Outlines')
+    return bool(outlines is not None and outlines.get_object().get('/First')) or '/AcroForm' in root
+
+@tool_handler('merge-pdf', parallel=True, memory='high')
+def merge_pdf(job):
+    out_path = output_path(job, '.pdf')
+    # low_memory=1 uses the streaming merger; so do very large inputs, as
+    # long as none of them has an outline or a form it would drop.
+    large = sum(item.size for item in job['inputs']) > MERGE_STREAM_BYTES
+    if job['options'].get('low_memory') == '1' or (
+            large and not any(has_outline_or_form(item) for item in job['inputs'])):
+        deduplicated = merge_streaming(job, out_path)
+        return {'path': out_path, 'streamed': True, 'deduplicated': deduplicated}
+    pypdf = lib('pypdf')
+    merger = pypdf.PdfWriter()
+    # Identical uploads (same digest) are parsed once and appended again.
+    readers, plan = {}, merge_plan(job)
+    progress = job_progress(job)
+    for done, (item, pages, bookmark) in enumerate(plan, 1):
+        if item.digest not in readers:
+            readers[item.digest] = pypdf.PdfReader(item.open())
+        reader = readers[item.digest]
+        merger.append(reader, outline_item=bookmark, pages=plan_pages(reader, pages))
+        progress(done, len(plan), 0, 'files')
+    # Inputs sharing a letterhead carry the same fonts and images; keep one.
+    deduplicated = dedupe_objects(merger)
+    merger.write(out_path)
+    merger.close()
+    progress(len(plan), len(plan), os.path.getsize(out_path), 'files')
+    return {'path': out_path, 'duplicates': len(plan) - len(readers),
+            'deduplicated': deduplicated}
+
+def split_pages(reader, groups):
+    # Yields (name, bytes) per group of page indexes, serialised in memory.
+    pypdf = lib('pypdf')
+    for group in groups:
+        writer = pypdf.PdfWriter()
+        for i in group:
+            writer.add_page(reader.pages[i])
+        buf = io.BytesIO()
+        writer.write(buf)
+        name = f"page_{group[0]+1}.pdf" if len(group) == 1 else f"pages_{group[0]+1}-{group[-1]+1}.pdf"
+        yield name, buf.getvalue()
+
+def split_chunk(item, groups):
+    # Process-pool worker: opens the source once for its share of the groups.
+    return list(split_pages(lib('pypdf').PdfReader(item.open()), groups))
+
+def split_groups(options, num_pages):
+    if options.get('ranges'):
+        groups = parse_page_ranges(options['ranges'], num_pages)
+        # Each group becomes one file named after its first and last page.
+        seen = set()
+        for group in groups:
+            if (group[0], group[-1]) in seen:
+                label = f"Page {group[0]+1}" if len(group) == 1 else f"Page range {group[0]+1}-{group[-1]+1}"
+                raise ValueError(f"{label} is listed more than once")
+            seen.add((group[0], group[-1]))
+        return groups
+    size = max(1, int(options.get('chunk_size') or 1))
+    return [list(range(i, min(i + size, num_pages))) for i in range(0, num_pages, size)]
+
+def split_outputs(item, groups, reader):
+    pages = sum(len(g) for g in groups)
+    if pages < SPLIT_PARALLEL_PAGES or PROCESS_WORKERS < 2:
+        yield from split_pages(reader, groups)
+        return
+    # Balance chunks by page count; map() keeps the results in order.
+    target = pages / (PROCESS_WORKERS * 2)
+    chunks, current, size = [], [], 0
+    for group in groups:
+        current.append(group)
+        size += len(group)
+        if size >= target:
+            chunks.append(current)
+            current, size = [], 0
+    if current:
+        chunks.append(current)
+    for outputs in fan_out_map(split_chunk, [item] * len(chunks), chunks):
+        yield from outputs
+
+@tool_handler('split-pdf', parallel=True, memory='medium', fan_out=True)
+def split_pdf(job):
+    item = job['inputs'][0]
+    reader = lib('pypdf').PdfReader(item.open())
+    groups = split_groups(job['options'], len(reader.pages))
+    zip_target = output_path(job, '.zip')
+    progress = job_progress(job)
+    total = sum(len(group) for group in groups)
+    done = written = 0
+    with zipfile.ZipFile(zip_target, 'w') as zf:
+        # split_outputs() yields one file per group, in order
+        for group, (name, data) in zip(groups, split_outputs(item, groups, reader)):
+            zf.writestr(name, data)
+            done += len(group)
+            written += len(data)
+            progress(done, total, written)
+    return {'path': zip_target}
+
+@tool_streamer('split-pdf', 'application/zip', '.zip')
+def split_pdf_stream(job):
+    reader = lib('pypdf').PdfReader(job['inputs'][0].open())
+    groups = split_groups(job['options'], len(reader.pages))
+    sink = ZipSink()
+    with zipfile.ZipFile(sink, 'w') as zf:
+        for name, data in split_pages(reader, groups):
+            zf.writestr(name, data)
+            yield sink.drain()
+    yield sink.drain()
+
+# compress-pdf presets, modelled on Ghostscript's -dPDFSETTINGS names.
+COMPRESS_PRESETS = {
+    'screen': {'dpi': 72, 'quality': 40},
+    'ebook': {'dpi': 150, 'quality': 60},
+    'printer': {'dpi': 300, 'quality': 80},
+}
+
+def _serialized(obj):
+    buf = io.BytesIO()
+    obj.write_to_stream(buf)
+    return buf.getvalue()
+
+def _children(obj):
+    if isinstance(obj, dict):
+        return list(obj.items())
+    if isinstance(obj, list):
+        return list(enumerate(obj))
+    return []
+
+def _remap_refs(obj, mapping, writer):
+    generic = lib('pypdf').generic
+    for key, value in _children(obj):
+        if isinstance(value, generic.IndirectObject):
+            if value.idnum in mapping:
+                obj[key] = generic.IndirectObject(mapping[value.idnum], 0, writer)
+        else:
+            _remap_refs(value, mapping, writer)
+
+def _ref_ids(obj, found):
+    generic = lib('pypdf').generic
+    for _, value in _children(obj):
+        if isinstance(value, generic.IndirectObject):
+            found.append(value.idnum)
+        else:
+            _ref_ids(value, found)
+    return found
+
+def recompress_content(writer):
+    before = after = 0
+    for page in writer.pages:
+        contents = page.get('/Contents')
+        if contents is None:
+            continue
+        parts = contents.get_object()
+        parts = parts if isinstance(parts, list) else [contents]
+        size = sum(len(p.get_object()._data) for p in parts)
+        try:
+            page.compress_content_streams(level=9)
+        except Exception as e:
+            print(f"WARNING: kept content stream as is: {e}")
+            before += size
+            after += size
+            continue
+        before += size
+        after += len(page['/Contents'].get_object()._data)
+    return {'before': before, 'after': after}
+
+def downsample_images(writer, dpi, quality):
+    Image = lib('PIL.Image')
+    before = after = 0
+    done = set()
+    for page in writer.pages:
+        # Cap pixels at what the target DPI needs to cover the whole page.
+        max_w = max(1, int(float(page.mediabox.width) / 72 * dpi))
+        max_h = max(1, int(float(page.mediabox.height) / 72 * dpi))
+        for img in page.images:
+            ref = img.indirect_reference
+            if ref is None or ref.idnum in done:
+                continue
+            done.add(ref.idnum)
+            xobj = ref.get_object()
+            # Masked and 1-bit images don't survive a JPEG round trip.
+            if '/SMask' in xobj or '/Mask' in xobj or xobj.get('/BitsPerComponent') == 1:
+                continue
+            size = len(xobj._data)
+            try:
+                pil = img.image
+                if pil.mode not in ('RGB', 'L'):
+                    pil = pil.convert('RGB')
+                if pil.width > max_w or pil.height > max_h:
+                    pil.thumbnail((max_w, max_h), Image.LANCZOS)
+                img.replace(pil, quality=quality)
+            except Exception as e:
+                print(f"WARNING: kept image {ref.idnum} as is: {e}")
+                writer._objects[ref.idnum - 1] = xobj
+                before += size
+                after += size
+                continue
+            new_size = len(ref.get_object()._data)
+            if new_size >= size:
+                writer._objects[ref.idnum - 1] = xobj
+                new_size = size
+            before += size
+            after += new_size
+    return {'before': before, 'after': after}
+
+DEDUPE_SKIP_TYPES = ('/Page', '/Pages', '/Catalog', '/Annot')
+
+def _dedupe_key(obj):
+    # (digest, size) for objects that may be shared, None for the rest.
+    if not isinstance(obj, dict) or obj.get('/Type') in DEDUPE_SKIP_TYPES:
+        return None
+    data = _serialized(obj)
+    return hashlib.sha256(data).digest(), len(data)
+
+def dedupe_objects(writer):
+    # Objects that serialise to the same bytes (fonts, images, ICC profiles,
+    # ...) are collapsed onto the first copy. Repeated until stable, since a
+    # merge can make the objects that refer to them identical too.
+    generic = lib('pypdf').generic
+    removed = saved = 0
+    while True:
+        seen, mapping = {}, {}
+        for i, obj in enumerate(writer._objects):
+            hashed = _dedupe_key(obj)
+            if hashed is None:
+                continue
+            key, size = hashed
+            if key in seen:
+                mapping[i + 1] = seen[key]
+                saved += size
+            else:
+                seen[key] = i + 1
+        if not mapping:
+            break
+        for obj in writer._objects:
+            if obj is not None:
+                _remap_refs(obj, mapping, writer)
+        _remap_refs(writer._root_object, mapping, writer)
+        for idnum in mapping:
+            writer._objects[idnum - 1] = generic.NullObject()
+        removed += len(mapping)
+    return {'objects': removed, 'bytes': saved}
+
+def remove_unused_objects(writer):
+    generic = lib('pypdf').generic
+    roots = [writer._root.idnum, writer._info.idnum]
+    if getattr(writer, '_encrypt', None) is not None:
+        roots.append(writer._encrypt.idnum)
+    reachable, todo = set(), roots
+    while todo:
+        idnum = todo.pop()
+        if idnum in reachable or not 0 < idnum <= len(writer._objects):
+            continue
+        reachable.add(idnum)
+        _ref_ids(writer._objects[idnum - 1], todo)
+    removed = saved = 0
+    for i, obj in enumerate(writer._objects):
+        if i + 1 not in reachable and obj is not None and not isinstance(obj, generic.NullObject):
+            saved += len(_serialized(obj))
+            removed += 1
+            writer._objects[i] = generic.NullObject()
+    return {'objects': removed, 'bytes': saved}
+
+@tool_handler('compress-pdf', parallel=True, cpu_bound=True, memory='high')
+def compress_pdf(job):
+    pypdf = lib('pypdf')
+    options = job['options']
+    preset = COMPRESS_PRESETS.get(options.get('preset') or 'ebook')
+    if preset is None:
+        raise ValueError(f"Unknown preset, use one of: {', '.join(COMPRESS_PRESETS)}")
+    dpi = int(options.get('dpi') or preset['dpi'])
+    quality = int(options.get('quality') or preset['quality'])
+
+    out_path = output_path(job, '.pdf')
+    reader = pypdf.PdfReader(job['inputs'][0].open())
+    writer = pypdf.PdfWriter()
+    writer.append_pages_from_reader(reader)
+    writer.add_metadata(reader.metadata)
+
+    stats = {
+        'content_streams': recompress_content(writer),
+        # Dedupe before touching images so each shared image is re-encoded once.
+        'duplicates': dedupe_objects(writer),
+        'images': downsample_images(writer, dpi, quality),
+        'unused': remove_unused_objects(writer),
+    }
+    with open(out_path, "wb") as f:
+        writer.write(f)
+    stats['total'] = {'before': job['inputs'][0].size, 'after': os.path.getsize(out_path)}
+    return {'path': out_path, 'stats': stats}
+
+@tool_handler('jpg-to-pdf', parallel=True, memory='medium')
+def jpg_to_pdf(job):
+    out_path = output_path(job, '.pdf')
+    with open(out_path, "wb") as f:
+        f.write(lib('img2pdf').convert([item.open() for item in job['inputs']]))
+    return {'path': out_path}
+
+@tool_handler('word-to-pdf', parallel=True, cpu_bound=True, memory='medium')
+def word_to_pdf(job):
+    out_path = output_path(job, '.pdf')
+    pages = docx_to_pdf_content(job['inputs'][0].open(), out_path)
+    return {'path': out_path, 'pages': pages}
+
+EXCEL_FONT, EXCEL_FONT_SIZE, EXCEL_ROW_HEIGHT, EXCEL_MARGIN = 'Helvetica', 8, 12, 30
+# Pages drawn before they are handed to the streaming merger.
+EXCEL_CHUNK_PAGES = int(os.environ.get('EXCEL_CHUNK_PAGES', 100))
+
+class PageChunks:
+    # A reportlab canvas whose pages are moved into a StreamingMerger every
+    # `limit` pages, so a long document never sits in memory as a whole.
+    def __init__(self, merger, pagesize, limit):
+        self.merger, self.pagesize, self.limit = merger, pagesize, limit
+        self.pages = 0
+        self._new()
+
+    def _new(self):
+        self.buf = io.BytesIO()
+        self.canvas = lib('reportlab.pdfgen.canvas').Canvas(self.buf, pagesize=self.pagesize)
+        self.pending = 0
+
+    def show_page(self):
+        self.canvas.showPage()
+        self.pages += 1
+        self.pending += 1
+        if self.pending >= self.limit:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.canvas.save()
+        self.merger.append(lib('pypdf').PdfReader(io.BytesIO(self.buf.getvalue())))
+        self._new()
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return f"{value:.10g}"
+    return str(value)
+
+EXCEL_SAMPLE_ROWS = 200
+EXCEL_MIN_COL, EXCEL_MAX_COL = 24, 220  # column width bounds, in points
+
+def _row_texts(row):
+    texts = [_cell_text(value) for value in row]
+    while texts and not texts[-1]:
+        texts.pop()
+    return texts
+
+def column_widths(rows, widths=None, font=EXCEL_FONT):
+    # Widest text per column across `rows`, padded and clamped; extends
+    # `widths` in place, so columns seen later only ever get wider.
+    widths = [] if widths is None else widths
+    for texts in rows:
+        for i, text in enumerate(texts):
+            needed = min(EXCEL_MAX_COL, max(EXCEL_MIN_COL, text_width(text, font, EXCEL_FONT_SIZE) + 7))
+            if i >= len(widths):
+                widths.append(needed)
+            elif needed > widths[i]:
+                widths[i] = needed
+    return widths
+
+def column_bands(widths, usable):
+    # Splits the columns into runs that each fit across one page.
+    bands, start, used = [], 0, 0.0
+    for i, w in enumerate(widths):
+        if i > start and used + w > usable:
+            bands.append((start, i))
+            start, used = i, 0.0
+        used += w
+    bands.append((start, len(widths)))
+    return bands
+
+def draw_sheet(chunks, ws, header_rows=1):
+    # Rows are read one page at a time, so the sheet is never held in memory
+    # as a whole. Column widths come from the first EXCEL_SAMPLE_ROWS rows
+    # (widened if a later page needs it, but fixed within the sample); a
+    # sheet wider than the page is tiled across several pages, each of which
+    # repeats the header rows.
+    width, height = chunks.pagesize
+    usable = width - 2 * EXCEL_MARGIN
+    top = height - EXCEL_MARGIN - 14
+    rows = (_row_texts(row) for row in ws.iter_rows(values_only=True))
+    sample = list(itertools.islice(rows, EXCEL_SAMPLE_ROWS))
+    header = sample[:header_rows]
+    widths = column_widths(header, font=EXCEL_FONT + '-Bold')
+    widths = [min(w, usable) for w in column_widths(sample[len(header):], widths)] or [usable]
+    per_page = max(1, int((top - EXCEL_MARGIN) // EXCEL_ROW_HEIGHT) - len(header))
+    get_letter = lib('openpyxl.utils').get_column_letter
+    page_no = 0
+
+    def draw(body):
+        nonlocal widths
+        if any(len(texts) > len(widths) for texts in body):
+            widths = [min(w, usable) for w in column_widths(body, list(widths))]
+        bands = column_bands(widths, usable)
+        for band_no, (first, last) in enumerate(bands):
+            c = chunks.canvas
+            label = f"{ws.title} - page {page_no}"
+            if len(bands) > 1:
+                label += f" ({band_no + 1}/{len(bands)}, columns {get_letter(first + 1)}-{get_letter(last)})"
+            c.setFont(EXCEL_FONT, 10)
+            c.drawString(EXCEL_MARGIN, height - EXCEL_MARGIN, label)
+            xs = [EXCEL_MARGIN]
+            for w in widths[first:last]:
+                xs.append(xs[-1] + w)
+            lines = header + body
+            ys = [top - i * EXCEL_ROW_HEIGHT for i in range(len(lines) + 1)]
+            if header:
+                c.setFillGray(0.9)
+                c.rect(xs[0], ys[len(header)], xs[-1] - xs[0], ys[0] - ys[len(header)], stroke=0, fill=1)
+                c.setFillGray(0)
+            c.setLineWidth(0.25)
+            c.grid(xs, ys)
+            # One text object per page; drawString() would start one per cell.
+            text_obj = c.beginText()
+            for r, texts in enumerate(lines):
+                font = EXCEL_FONT + '-Bold' if r < len(header) else EXCEL_FONT
+                text_obj.setFont(font, EXCEL_FONT_SIZE)
+                for i, text in enumerate(texts[first:last]):
+                    if text:
+                        text_obj.setTextOrigin(xs[i] + 3, ys[r + 1] + 3)
+                        text_obj.textOut(fit_text(text, font, EXCEL_FONT_SIZE, xs[i + 1] - xs[i] - 6))
             c.drawText(text_obj)
-            c.showPage()
-            text_obj = c.beginText(40, 750)
-    c.drawText(text_obj)
+            chunks.show_page()
+
+    page = []
+    for texts in itertools.chain(sample[len(header):], rows):
+        page.append(texts)
+        if len(page) == per_page:
+            page_no += 1
+            draw(page)
+            page = []
+    if page or not page_no:
+        page_no += 1
+        draw(page)
+
+@tool_handler('excel-to-pdf', parallel=True, cpu_bound=True, memory='medium')
+def excel_to_pdf(job):
+    # Every sheet, streamed: openpyxl reads rows lazily (read_only) and the
+    # pages go out through the streaming merger in chunks, so time grows
+    # with the row count and memory stays flat.
+    try:
+        header_rows = int(job['options'].get('header_rows') or 1)
+    except ValueError:
+        header_rows = -1
+    if not 0 <= header_rows <= 10:
+        raise ValueError('header_rows must be a whole number from 0 to 10')
+    out_path = output_path(job, '.pdf')
+    pagesizes = lib('reportlab.lib.pagesizes')
+    wb = lib('openpyxl').load_workbook(job['inputs'][0].open(), read_only=True, data_only=True)
+    try:
+        with open(out_path, 'wb') as out:
+            merger = StreamingMerger(out)
+            chunks = PageChunks(merger, pagesizes.landscape(pagesizes.A4), EXCEL_CHUNK_PAGES)
+            for ws in wb.worksheets:
+                draw_sheet(chunks, ws, header_rows)
+            chunks.flush()
+            merger.close()
+    finally:
+        wb.close()
+    return {'path': out_path, 'sheets': len(wb.worksheets), 'pages': chunks.pages}
+
+@tool_handler('html-to-pdf', parallel=True, cpu_bound=True, memory='medium')
+def html_to_pdf(job):
+    out_path = output_path(job, '.pdf')
+    with open(out_path, "wb") as dest:
+        lib('xhtml2pdf.pisa').CreatePDF(job['inputs'][0].read().decode('utf-8', errors='ignore'), dest=dest)
+    return {'path': out_path}
+
+def parse_word_pages(path, pages):
+    # Process-pool worker: pdf2docx layout analysis for some pages, returned
+    # in pdf2docx's own serialised form. This is the expensive step.
+    cv = lib('pdf2docx').Converter(path)
+    # The pool is already one process per core; OpenCV's own thread pool in
+    # every worker would oversubscribe the host.
+    lib('cv2').setNumThreads(1)
+    try:
+        settings = cv.default_settings
+        return cv.load_pages(pages=pages).parse_document(**settings).parse_pages(**settings).store()
+    finally:
+        cv.close()
+
+@tool_handler('pdf-to-word', parallel=True, memory='medium', fan_out=True)
+def pdf_to_word(job):
+    # Page ranges are parsed on the shared process pool, whose workers keep
+    # fitz and OpenCV imported; the pool size caps the CPU used by all
+    # conversions together and PDF_TO_WORD_PROCESSES the share of one job.
+    # The parsed pages are then written to one .docx here. pdf2docx's own
+    # multi_processing mode starts a fresh Pool (cold imports) per call and
+    # writes its scratch files to the working directory, so it is not used.
+    out_path = output_path(job, '.docx')
+    # pdf2docx wants a filename, so this is the one tool that spills to disk.
+    path = job['inputs'][0].path
+    cv = lib('pdf2docx').Converter(path)
+    try:
+        count = len(cv.fitz_doc)
+        chunks = min(PDF_TO_WORD_PROCESSES, max(1, count // PDF_TO_WORD_CHUNK_PAGES)) or 1
+        step = -(-count // chunks) or 1
+        ranges = [list(range(i, min(i + step, count))) for i in range(0, count, step)] or [[]]
+        progress = job_progress(job)
+        done = 0
+        for pages, data in zip(ranges, fan_out_map(parse_word_pages, [path] * len(ranges), ranges)):
+            cv.restore(data)
+            done += len(pages)
+            progress(done, count, 0)
+        cv.make_docx(out_path, **cv.default_settings)
+        progress(count, count, os.path.getsize(out_path))
+    finally:
+        cv.close()
+    return {'path': out_path, 'pages': count, 'workers': len(ranges)}
+
+# Escapes accepted in the pdf-to-txt separator field, which is typed into a
+# text box (e.g. "\f" for a form feed between pages).
+TEXT_ESCAPES = {'\\n': '\n', '\\f': '\f', '\\t': '\t'}
+TEXT_ORIENTATIONS = {'all': (0, 90, 180, 270), 'upright': (0,)}
+
+def text_options(options):
+    # extract_text() keyword arguments and the page separator from the form.
+    kwargs = {'orientations': TEXT_ORIENTATIONS.get(options.get('orientation') or 'all')}
+    if kwargs['orientations'] is None:
+        raise ValueError('Unknown orientation')
+    if options.get('space_width'):
+        kwargs['space_width'] = float(options['space_width'])
+    separator = options.get('separator') or '\\n\\n'
+    for escape, char in TEXT_ESCAPES.items():
+        separator = separator.replace(escape, char)
+    return kwargs, separator
+
+def page_text(page, kwargs):
+    return page.extract_text(**kwargs)
+
+def page_record(page, kwargs, positions=False):
+    # pdf-to-json: one page as a dict. With positions, the text is also
+    # given as lines, each with the user-space origin (x, y) of its first
+    # fragment and its font size, as reported by the visitor callback.
+    lines = []
+
+    def visit(text, cm, tm, font_dict, font_size):
+        if not text.strip():
+            return
+        # Origin and text y-axis of the text matrix times the current
+        # transformation matrix; the font size scales with the y-axis length.
+        x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+        y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+        c = tm[2] * cm[0] + tm[3] * cm[2]
+        d = tm[2] * cm[1] + tm[3] * cm[3]
+        size = font_size * (c * c + d * d) ** 0.5
+        if lines and abs(lines[-1]['y'] - y) < lines[-1]['size'] / 2:
+            lines[-1]['text'] += text
+        else:
+            lines.append({'text': text, 'x': x, 'y': y, 'size': size})
+
+    text = page.extract_text(visitor_text=visit if positions else None, **kwargs)
+    box = page.mediabox
+    record = {'width': float(box.width), 'height': float(box.height), 'text': text}
+    if positions:
+        record['lines'] = [{'text': line['text'].strip(), 'x': round(line['x'], 2), 'y': round(line['y'], 2),
+                            'size': round(line['size'], 2)} for line in lines]
+    return record
+
+def extract_text_chunk(item, pages, kwargs, extract):
+    # Process-pool worker: opens the source once for its range of pages.
+    reader = lib('pypdf').PdfReader(item.open())
+    return [extract(reader.pages[i], kwargs) for i in pages]
+
+def extracted_texts(item, reader, kwargs, extract=page_text):
+    # Yields extract(page, kwargs) for every page, in page order.
+    count = len(reader.pages)
+    if count < TEXT_PARALLEL_PAGES or PROCESS_WORKERS < 2:
+        for page in reader.pages:
+            yield extract(page, kwargs)
+        return
+    # Contiguous ranges, two per worker; map() keeps the results in order.
+    step = -(-count // (PROCESS_WORKERS * 2))
+    ranges = [range(i, min(i + step, count)) for i in range(0, count, step)]
+    for texts in fan_out_map(extract_text_chunk, [item] * len(ranges), ranges,
+                             [kwargs] * len(ranges), [extract] * len(ranges)):
+        yield from texts
+
+def page_texts(job):
+    # Yields (pages done, page count, text) in page order.
+    item = job['inputs'][0]
+    kwargs, separator = text_options(job['options'])
+    reader = lib('pypdf').PdfReader(item.open())
+    count = len(reader.pages)
+    for done, text in enumerate(extracted_texts(item, reader, kwargs), 1):
+        yield done, count, text + separator
+
+def page_records(job):
+    # Yields (pages done, page count, line) where line is one page as a
+    # newline-terminated JSON object, in page order.
+    item = job['inputs'][0]
+    kwargs, _ = text_options(job['options'])
+    extract = partial(page_record, positions=job['options'].get('positions') == 'yes')
+    reader = lib('pypdf').PdfReader(item.open())
+    count = len(reader.pages)
+    for done, record in enumerate(extracted_texts(item, reader, kwargs, extract), 1):
+        yield done, count, json.dumps(dict(page=done, **record), ensure_ascii=False) + "\n"
+
+@tool_handler('pdf-to-txt', parallel=True, memory='medium', fan_out=True)
+def pdf_to_txt(job):
+    out_path = output_path(job, '.txt')
+    progress = job_progress(job)
+    with open(out_path, "w", encoding="utf-8") as f:
+        for done, count, text in page_texts(job):
+            f.write(text)
+            progress(done, count, f.tell())
+    return {'path': out_path}
+
+@tool_streamer('pdf-to-txt', 'text/plain', '.txt')
+def pdf_to_txt_stream(job):
+    # Each page goes out as its own chunk as soon as it is extracted.
+    for _, _, text in page_texts(job):
+        yield text.encode('utf-8')
+
+@tool_handler('pdf-to-json', parallel=True, memory='medium', fan_out=True)
+def pdf_to_json(job):
+    out_path = output_path(job, '.ndjson')
+    progress = job_progress(job)
+    with open(out_path, "w", encoding="utf-8") as f:
+        for done, count, line in page_records(job):
+            f.write(line)
+            progress(done, count, f.tell())
+    return {'path': out_path}
+
+@tool_streamer('pdf-to-json', 'application/x-ndjson', '.ndjson')
+def pdf_to_json_stream(job):
+    for _, _, line in page_records(job):
+        yield line.encode('utf-8')
+
+@tool_handler('protect-pdf')
+def protect_pdf(job):
+    pypdf = lib('pypdf')
+    out_path = output_path(job, '.pdf')
+    reader = pypdf.PdfReader(job['inputs'][0].open())
+    writer = pypdf.PdfWriter()
+    writer.append_pages_from_reader(reader)
+    writer.encrypt(job['options']['password'])
+    writer.write(out_path)
+    return {'path': out_path}
+
+@tool_handler('unlock-pdf')
+def unlock_pdf(job):
+    pypdf = lib('pypdf')
+    out_path = output_path(job, '.pdf')
+    reader = pypdf.PdfReader(job['inputs'][0].open())
+    if reader.is_encrypted:
+        reader.decrypt(job['options']['password'])
+    writer = pypdf.PdfWriter()
+    writer.append_pages_from_reader(reader)
+    writer.write(out_path)
+    return {'path': out_path}
+
+@tool_handler('remove-pages', 'extract-pages')
+def select_pages(job):
+    # Only the kept pages and the objects they use are cloned; content
+    # streams are copied as stored, never decoded. Links and outline
+    # entries pointing at dropped pages are left out by append().
+    pypdf = lib('pypdf')
+    reader = pypdf.PdfReader(job['inputs'][0].open())
+    selected = parse_page_selection(job['options'].get('pages') or '1', len(reader.pages))
+    if job['slug'] == 'remove-pages':
+        removed = set(selected)
+        selected = [i for i in range(len(reader.pages)) if i not in removed]
+        if not selected:
+            raise ValueError('Cannot remove every page')
+    writer = pypdf.PdfWriter()
+    writer.append(reader, pages=selected)
+    out_path = output_path(job, '.pdf')
+    writer.write(out_path)
+    return {'path': out_path, 'pages': len(selected)}
+
+def update_base(reader, stream):
+    # Offset of the input's last xref section if an incremental update can
+    # be chained to it: the file is unencrypted and its startxref is sound
+    # (pypdf repairs a bad one in memory only). None otherwise.
+    if reader.is_encrypted or reader.xref_index:
+        return None
+    stream.seek(0, os.SEEK_END)
+    stream.seek(max(0, stream.tell() - 1024))
+    tail = stream.read()
+    pos = tail.rfind(b'startxref')
+    try:
+        startxref = int(tail[pos + 9:].split()[0]) if pos >= 0 else None
+    except (ValueError, IndexError):
+        return None
+    if startxref is None:
+        return None
+    stream.seek(startxref)
+    head = stream.read(32).split()
+    if head[:1] == [b'xref'] or (len(head) >= 3 and head[0].isdigit() and head[1].isdigit() and head[2].startswith(b'obj')):
+        return startxref
+    return None
+
+def append_update(out, reader, objects, startxref):
+    # Writes an incremental update after a copy of the input: the changed
+    # objects under their own numbers, and an xref section chained to the
+    # original one by /Prev. Nothing else in the file is read or rewritten.
+    generic = lib('pypdf').generic
+    out.write(b"\n")
+    offsets = {}
+    for obj in objects:
+        ref = obj.indirect_reference
+        offsets[ref.idnum] = (out.tell(), ref.generation)
+        out.write(f"{ref.idnum} {ref.generation} obj\n".encode())
+        obj.write_to_stream(out)
+        out.write(b"\nendobj\n")
+    xref = out.tell()
+    # Object 0 heads the first subsection, as readers expect
+    out.write(b"xref\n0 1\n0000000000 65535 f \n")
+    for idnum in sorted(offsets):
+        offset, generation = offsets[idnum]
+        out.write(f"{idnum} 1\n{offset:010d} {generation:05d} n \n".encode())
+    trailer = generic.DictionaryObject({key: value for key, value in reader.trailer.items()
+                                        if key in ('/Size', '/Root', '/Info', '/ID')})
+    trailer[generic.NameObject('/Prev')] = generic.NumberObject(startxref)
+    out.write(b"trailer\n")
+    trailer.write_to_stream(out)
+    out.write(f"\nstartxref\n{xref}\n%%EOF\n".encode())
+
+@tool_handler('rotate-pdf')
+def rotate_pdf(job):
+    # Only /Rotate changes, so the rotated page dictionaries are appended to
+    # the original as an incremental update; the time taken depends on the
+    # number of pages, not on the size of their content.
+    pypdf = lib('pypdf')
+    generic = pypdf.generic
+    angle = job['options'].get('angle') or '90'
+    if angle not in INPUT_FIELDS['angle']['choices']:
+        raise ValueError('Angle must be 90, 180 or 270')
+    src = job['inputs'][0].open()
+    reader = pypdf.PdfReader(src)
+    selected = parse_page_selection(job['options'].get('pages') or '1-', len(reader.pages))
+    out_path = output_path(job, '.pdf')
+    startxref = update_base(reader, src)
+    if startxref is None:
+        writer = pypdf.PdfWriter()
+        writer.append(reader)
+        pages = [writer.pages[i] for i in selected]
+    else:
+        pages = [reader.pages[i] for i in selected]
+    for page in pages:
+        # reader.pages has already resolved an inherited /Rotate
+        page[generic.NameObject('/Rotate')] = generic.NumberObject((page.rotation + int(angle)) % 360)
+    if startxref is None:
+        writer.write(out_path)
+    else:
+        src.seek(0)
+        with open(out_path, 'wb') as out:
+            shutil.copyfileobj(src, out)
+            append_update(out, reader, pages, startxref)
+    return {'path': out_path, 'pages': len(selected), 'incremental': startxref is not None}
+
+SLIDE_FONTS = {(False, False): 'Helvetica', (True, False): 'Helvetica-Bold',
+               (False, True): 'Helvetica-Oblique', (True, True): 'Helvetica-BoldOblique'}
+
+def _shape_color(fill):
+    # RGB of a solid fill as a reportlab colour; None for anything else
+    # (theme colours, gradients, pictures, no fill).
+    try:
+        if fill.type != lib('pptx.enum.dml').MSO_FILL.SOLID:
+            return None
+        rgb = fill.fore_color.rgb
+    except (AttributeError, TypeError):
+        return None
+    return lib('reportlab.lib.colors').HexColor(f"#{rgb}")
+
+def _draw_text_frame(c, shape, box):
+    # Word-wraps the runs of each paragraph inside the shape's margins,
+    # keeping each run's size, weight, slant and colour.
+    pptx_text = lib('pptx.enum.text')
+    width_of = lib('reportlab.pdfbase.pdfmetrics').stringWidth
+    frame = shape.text_frame
+    x, y, w, h = box
+    left = x + (frame.margin_left or 0) / EMU_PER_POINT
+    right = x + w - (frame.margin_right or 0) / EMU_PER_POINT
+    is_title = getattr(shape, 'is_placeholder', False) and 'TITLE' in str(shape.placeholder_format.type)
+    default_size = 40 if is_title else 18
+    # (alignment, height, segments); a segment is [text, font, size, colour]
+    # and runs on while the style stays the same, so text extracts cleanly.
+    lines = []
+    for para in frame.paragraphs:
+        words, line, line_width = [], [], 0.0
+        for run in para.runs:
+            font = run.font
+            name = SLIDE_FONTS[bool(font.bold), bool(font.italic)]
+            size = font.size.pt if font.size else default_size
+            try:
+                colour = lib('reportlab.lib.colors').HexColor(f"#{font.color.rgb}") if font.color.type else None
+            except (AttributeError, TypeError):
+                colour = None
+            words.extend((word, name, size, colour) for word in run.text.split())
+        if not words:
+            lines.append((para.alignment, default_size * 1.2, []))
+            continue
+        for word, name, size, colour in words:
+            piece = ' ' + word if line else word
+            piece_width = width_of(piece, name, size)
+            if line and line_width + piece_width > right - left:
+                lines.append((para.alignment, max(seg[2] for seg in line) * 1.2, line))
+                line, line_width = [], 0.0
+                piece, piece_width = word, width_of(word, name, size)
+            if line and line[-1][1:] == [name, size, colour]:
+                line[-1][0] += piece
+            else:
+                line.append([piece, name, size, colour])
+            line_width += piece_width
+        lines.append((para.alignment, max(seg[2] for seg in line) * 1.2, line))
+    total = sum(height for _, height, _ in lines)
+    top = y + h - (frame.margin_top or 0) / EMU_PER_POINT
+    anchor = frame.vertical_anchor
+    if anchor == lib('pptx.enum.text').MSO_ANCHOR.MIDDLE:
+        top -= max(0, (h - total) / 2)
+    elif anchor == lib('pptx.enum.text').MSO_ANCHOR.BOTTOM:
+        top -= max(0, h - total)
+    for alignment, height, line in lines:
+        top -= height
+        if not line:
+            continue
+        used = sum(width_of(text, name, size) for text, name, size, _ in line)
+        cursor = left
+        if alignment == pptx_text.PP_ALIGN.CENTER:
+            cursor = left + (right - left - used) / 2
+        elif alignment == pptx_text.PP_ALIGN.RIGHT:
+            cursor = right - used
+        for text, name, size, colour in line:
+            c.setFont(name, size)
+            c.setFillColor(colour or lib('reportlab.lib.colors').black)
+            c.drawString(cursor, top + height * 0.2, text)
+            cursor += width_of(text, name, size)
+
+def _draw_shape(c, shape, page_height):
+    shapes = lib('pptx.enum.shapes')
+    if shape.shape_type == shapes.MSO_SHAPE_TYPE.GROUP:
+        for child in shape.shapes:
+            _draw_shape(c, child, page_height)
+        return
+    if shape.width is None or shape.left is None:
+        return
+    w, h = shape.width / EMU_PER_POINT, shape.height / EMU_PER_POINT
+    x = shape.left / EMU_PER_POINT
+    y = page_height - shape.top / EMU_PER_POINT - h
+    if shape.shape_type == shapes.MSO_SHAPE_TYPE.PICTURE:
+        try:
+            image = lib('reportlab.lib.utils').ImageReader(io.BytesIO(shape.image.blob))
+            c.drawImage(image, x, y, w, h, mask='auto')
+        except Exception:
+            pass  # formats Pillow cannot read (EMF/WMF) are left out
+        return
+    if hasattr(shape, 'begin_x'):  # connectors and lines
+        colour = _shape_color(shape.line.fill) or lib('reportlab.lib.colors').black
+        c.setStrokeColor(colour)
+        c.setLineWidth(shape.line.width.pt or 1)
+        c.line(shape.begin_x / EMU_PER_POINT, page_height - shape.begin_y / EMU_PER_POINT,
+               shape.end_x / EMU_PER_POINT, page_height - shape.end_y / EMU_PER_POINT)
+        return
+    if shape.shape_type == shapes.MSO_SHAPE_TYPE.AUTO_SHAPE:
+        fill, stroke = _shape_color(shape.fill), _shape_color(shape.line.fill)
+        if fill or stroke:
+            c.setFillColor(fill or lib('reportlab.lib.colors').white)
+            c.setStrokeColor(stroke or lib('reportlab.lib.colors').black)
+            c.setLineWidth(shape.line.width.pt or 1)
+            kind = shape.auto_shape_type
+            if kind == shapes.MSO_AUTO_SHAPE_TYPE.OVAL:
+                c.ellipse(x, y, x + w, y + h, stroke=bool(stroke), fill=bool(fill))
+            elif kind == shapes.MSO_AUTO_SHAPE_TYPE.ROUNDED_RECTANGLE:
+                c.roundRect(x, y, w, h, min(w, h) / 6, stroke=bool(stroke), fill=bool(fill))
+            else:
+                c.rect(x, y, w, h, stroke=bool(stroke), fill=bool(fill))
+    if getattr(shape, 'has_table', False):
+        table = shape.table
+        row_top = y + h
+        for row in table.rows:
+            row_height = row.height / EMU_PER_POINT
+            cell_left = x
+            for column, cell in zip(table.columns, row.cells):
+                cell_width = column.width / EMU_PER_POINT
+                c.setStrokeColor(lib('reportlab.lib.colors').grey)
+                c.setLineWidth(0.5)
+                c.rect(cell_left, row_top - row_height, cell_width, row_height)
+                _draw_text_frame(c, cell, (cell_left, row_top - row_height, cell_width, row_height))
+                cell_left += cell_width
+            row_top -= row_height
+        return
+    if shape.has_text_frame:
+        _draw_text_frame(c, shape, (x, y, w, h))
+
+def render_slides(item, indexes):
+    # Renders the given slides to a PDF, one page per slide sized like the
+    # deck. Also the process-pool worker for large decks.
+    prs = lib('pptx').Presentation(item.open())
+    size = (prs.slide_width / EMU_PER_POINT, prs.slide_height / EMU_PER_POINT)
+    buf = io.BytesIO()
+    c = lib('reportlab.pdfgen.canvas').Canvas(buf, pagesize=size)
+    slides = prs.slides
+    for i in indexes:
+        for shape in slides[i].shapes:
+            _draw_shape(c, shape, size[1])
+        c.showPage()
     c.save()
+    return buf.getvalue()
+
+@tool_handler('ppt-to-pdf', parallel=True, memory='medium', fan_out=True)
+def ppt_to_pdf(job):
+    # Text frames, tables, pictures, lines and rectangle/oval fills of the
+    # slides themselves; master and layout decorations are not drawn.
+    item = job['inputs'][0]
+    count = len(lib('pptx').Presentation(item.open()).slides)
+    if not count:
+        raise ValueError('The presentation has no slides')
+    out_path = output_path(job, '.pdf')
+    if count < PPT_PARALLEL_SLIDES or PROCESS_WORKERS < 2:
+        with open(out_path, 'wb') as f:
+            f.write(render_slides(item, range(count)))
+        return {'path': out_path, 'slides': count}
+    # Contiguous slide ranges, two per worker; map() keeps them in order
+    # for stitching.
+    step = -(-count // (PROCESS_WORKERS * 2))
+    chunks = [range(i, min(i + step, count)) for i in range(0, count, step)]
+    pypdf = lib('pypdf')
+    writer = pypdf.PdfWriter()
+    for data in fan_out_map(render_slides, [item] * len(chunks), chunks):
+        writer.append(pypdf.PdfReader(io.BytesIO(data)))
+    # Each chunk embeds its own copy of a picture used on several slides.
+    dedupe_objects(writer)
+    writer.write(out_path)
+    return {'path': out_path, 'slides': count}
+
+# --- 3. DISPATCHER ---
+# Concurrent runs allowed per slug, by the handler's memory cost. Single
+# slugs can be capped with e.g. TOOL_LIMITS="pdf-to-word=1,excel-to-pdf=2".
+TOOL_CONCURRENCY = {'low': 8, 'medium': 4, 'high': 2}
+TOOL_LIMITS = {slug.strip(): int(n) for slug, n in
+               (item.split('=') for item in os.environ.get('TOOL_LIMITS', '').split(',') if '=' in item)}
+THREAD_WORKERS = int(os.environ.get('THREAD_WORKERS', 4))
+PROCESS_WORKERS = int(os.environ.get('PROCESS_WORKERS', os.cpu_count() or 1))
+# split-pdf fans out to the process pool from this many output pages on,
+# pdf-to-txt from this many input pages on, ppt-to-pdf from this many
+# slides on.
+SPLIT_PARALLEL_PAGES = int(os.environ.get('SPLIT_PARALLEL_PAGES', 200))
+TEXT_PARALLEL_PAGES = int(os.environ.get('TEXT_PARALLEL_PAGES', 200))
+PPT_PARALLEL_SLIDES = int(os.environ.get('PPT_PARALLEL_SLIDES', 20))
+# pdf-to-word: most worker processes one job may use, and the fewest pages
+# worth giving a worker of its own.
+PDF_TO_WORD_PROCESSES = int(os.environ.get('PDF_TO_WORD_PROCESSES', PROCESS_WORKERS))
+PDF_TO_WORD_CHUNK_PAGES = int(os.environ.get('PDF_TO_WORD_CHUNK_PAGES', 10))
+# Worker processes are replaced after this many jobs so memory leaked by
+# the C libraries (PyMuPDF, OpenCV, reportlab) cannot pile up.
+PROCESS_MAX_TASKS = int(os.environ.get('PROCESS_MAX_TASKS', 50))
+
+TOOL_STATS = {}  # slug -> {'mode', 'runs', 'errors', 'seconds', 'last_seconds'}
+_lock = threading.Lock()
+_slots = {}
+_pools = {}
+
+def execution_mode(handler):
+    if not handler['parallel']:
+        return 'inline'
+    if handler['cpu_bound'] or handler['memory'] == 'high':
+        return 'process'
+    return 'thread'
+
+def _tool_slot(slug):
+    with _lock:
+        if slug not in _slots:
+            limit = TOOL_LIMITS.get(slug, TOOL_CONCURRENCY[HANDLERS[slug]['memory']])
+            _slots[slug] = threading.BoundedSemaphore(limit)
+        return _slots[slug]
+
+def _process_pool():
+    # Workers import a tool's deps through lib() the first time they run
+    # it, and keep them for later jobs; nothing is preloaded, so a cold
+    # worker only pays for the tool it was started for.
+    options = {
+        'max_workers': PROCESS_WORKERS,
+        'mp_context': multiprocessing.get_context('spawn'),
+    }
+    if sys.version_info >= (3, 11):
+        options['max_tasks_per_child'] = PROCESS_MAX_TASKS
+    return ProcessPoolExecutor(**options)
+
+def _executor(mode):
+    with _lock:
+        if mode == 'process' and 'process' not in _pools:
+            try:
+                _pools['process'] = _process_pool()
+            except (OSError, NotImplementedError) as e:
+                # No working multiprocessing (e.g. missing /dev/shm): use threads.
+                print(f"WARNING: process pool unavailable ({e}), using threads")
+                _pools['process'] = None
+        if mode == 'thread' or _pools['process'] is None:
+            if 'thread' not in _pools:
+                _pools['thread'] = ThreadPoolExecutor(max_workers=THREAD_WORKERS)
+            return _pools['thread']
+        return _pools['process']
+
+def _drop_pool(executor):
+    # A worker died (OOM, segfault); the next job starts a fresh pool.
+    with _lock:
+        if _pools.get('process') is executor:
+            del _pools['process']
+
+def fan_out_map(fn, *iterables):
+    # map() for handlers that farm chunks out to the process pool. Those
+    # handlers already hold a thread-pool worker, so when the process pool
+    # is unavailable the chunks run here instead of being queued behind
+    # them on the same thread pool, where they could wait forever.
+    executor = _executor('process')
+    if _pools['process'] is None:
+        yield from map(fn, *iterables)
+        return
+    try:
+        yield from executor.map(fn, *iterables)
+    except BrokenProcessPool:
+        _drop_pool(executor)
+        raise
+
+def run_handler(slug, job):
+    load_tool_deps(slug)
+    return HANDLERS[slug]['run'](job)
+
+def run_in_worker(slug, job):
+    # Process-pool entry point. The worker's import timings for the tool go
+    # back with the result, since they are recorded in the worker.
+    result = run_handler(slug, job)
+    return result, TOOL_IMPORT_TIMINGS[slug]
+
+def _record_imports(slug, timings):
+    with _lock:
+        if slug not in TOOL_IMPORT_TIMINGS:
+            TOOL_IMPORT_TIMINGS[slug] = timings
+        for name, seconds in timings['modules'].items():
+            IMPORT_TIMINGS.setdefault(name, seconds)
+
+def _record_run(slug, mode, elapsed, ok):
+    with _lock:
+        stats = TOOL_STATS.setdefault(slug, {'mode': mode, 'runs': 0, 'errors': 0, 'seconds': 0.0})
+        stats['runs'] += 1
+        stats['errors'] += 0 if ok else 1
+        stats['seconds'] = round(stats['seconds'] + elapsed, 4)
+        stats['last_seconds'] = round(elapsed, 4)
+
+def run_tool(slug, job):
+    mode = execution_mode(HANDLERS[slug])
+    with _tool_slot(slug):
+        start = time.perf_counter()
+        ok = False
+        try:
+            if mode == 'inline':
+                result = run_handler(slug, job)
+            else:
+                executor = _executor(mode)
+                try:
+                    if mode == 'process':
+                        result, timings = executor.submit(run_in_worker, slug, job).result()
+                        _record_imports(slug, timings)
+                    else:
+                        result = executor.submit(run_handler, slug, job).result()
+                except BrokenProcessPool:
+                    _drop_pool(executor)
+                    raise RuntimeError('Conversion worker crashed, please try again')
+            ok = True
+            return result
+        finally:
+            _record_run(slug, mode, time.perf_counter() - start, ok)
+
+def stream_tool(slug, job):
+    # Generator counterpart of run_tool for handlers with a streamer; it
+    # runs in the request thread while the response is being sent.
+    load_tool_deps(slug)
+    with _tool_slot(slug):
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield from HANDLERS[slug]['stream'](job)
+            ok = True
+        finally:
+            _record_run(slug, 'stream', time.perf_counter() - start, ok)
+
+def start_stream(slug, job):
+    # Runs the streamer up to its first chunk before the response starts,
+    # so bad options and unreadable inputs still raise in process_file and
+    # get its JSON errors instead of a broken stream.
+    chunks = stream_tool(slug, job)
+    first = next(chunks, None)
+
+    def resume():
+        if first is not None:
+            yield first
+        yield from chunks
+    return resume()
+
+# --- RESULT CACHE ---
+# Results are keyed by the hash of the input bytes, the slug and the tool
+# options, so retries and repeated conversions of the same file are served
+# without running the tool again.
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(UPLOAD_FOLDER, 'result-cache'))
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 128 * 1024 * 1024))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 512))
+# Cached outputs are user files too, so they are kept no longer than a
+# session would be (see the privacy policy).
+CACHE_TTL = min(int(os.environ.get('CACHE_TTL', SESSION_TTL)), SESSION_TTL)
+# Form fields that only change how a result is delivered, not its content.
+CACHE_IGNORED_OPTIONS = ('async', 'stream', 'sha256[]')
+# Part of every key; bump it when a tool's output changes so results
+# cached by an older version are not served.
+CACHE_VERSION = 8
+
+class DiskCache:
+    # LRU cache of result files on local disk. Any object with the same
+    # get(key, folder) / put(key, result) / stats() methods can replace it
+    # (e.g. one backed by shared object storage).
+    def __init__(self, root, max_bytes, max_entries, ttl):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> {'name', 'bytes', 'extra', 'stored'}, oldest first
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        # Pick up entries written by an earlier process or a sibling worker.
+        metas = [e for e in os.scandir(root) if e.name.endswith('.json')]
+        for entry in sorted(metas, key=lambda e: e.stat().st_mtime):
+            try:
+                with open(entry.path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            meta.setdefault('stored', entry.stat().st_mtime)
+            self.entries[entry.name[:-5]] = meta
+        self.expire()
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key, folder):
+        with self.lock:
+            meta = self.entries.get(key)
+            if meta is not None and meta['stored'] < time.time() - self.ttl:
+                # Expired but not swept yet.
+                meta = None
+            if meta is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+        path = os.path.join(folder, meta['name'])
+        try:
+            _link_or_copy(self._path(key), path)
+        except OSError:
+            # Evicted by another worker in the meantime.
+            with self.lock:
+                self.entries.pop(key, None)
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return dict(meta['extra'], path=path, cached=True)
+
+    def put(self, key, result):
+        size = os.path.getsize(result['path'])
+        if size > self.max_bytes:
+            return
+        meta = {'name': os.path.basename(result['path']), 'bytes': size, 'stored': time.time(),
+                'extra': {k: v for k, v in result.items() if k != 'path'}}
+        _link_or_copy(result['path'], self._path(key))
+        with open(self._path(key) + '.json', 'w') as f:
+            json.dump(meta, f)
+        with self.lock:
+            self.entries[key] = meta
+            self.entries.move_to_end(key)
+            victims = []
+            total = sum(m['bytes'] for m in self.entries.values())
+            while self.entries and (total > self.max_bytes or len(self.entries) > self.max_entries):
+                old_key, old = self.entries.popitem(last=False)
+                total -= old['bytes']
+                victims.append(old_key)
+        self._remove(victims)
+
+    def expire(self):
+        # Called by the session sweeper; drops entries older than ttl.
+        cutoff = time.time() - self.ttl
+        with self.lock:
+            victims = [key for key, meta in self.entries.items() if meta['stored'] < cutoff]
+            for key in victims:
+                del self.entries[key]
+        self._remove(victims)
+        return len(victims)
+
+    def _remove(self, keys):
+        for key in keys:
+            for path in (self._path(key), self._path(key) + '.json'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': sum(m['bytes'] for m in self.entries.values()),
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+def _link_or_copy(src, dest):
+    # Hard links keep a hit free; fall back to a copy across filesystems.
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+RESULT_CACHE = DiskCache(CACHE_DIR, CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, CACHE_TTL) if CACHE_MAX_BYTES > 0 else None
+
+def cache_key(job):
+    h = hashlib.sha256(f"{CACHE_VERSION}:{job['slug']}".encode())
+    for item in job['inputs']:
+        h.update(item.digest.encode())
+    options = {k: v for k, v in job['options'].items() if k not in CACHE_IGNORED_OPTIONS}
+    h.update(json.dumps(options, sort_keys=True).encode())
+    return h.hexdigest()
+
+def cached_result(job):
+    if RESULT_CACHE is None:
+        return None
+    return RESULT_CACHE.get(cache_key(job), job['folder'])
+
+def run_and_cache(slug, job):
+    result = run_tool(slug, job)
+    if RESULT_CACHE is not None:
+        try:
+            RESULT_CACHE.put(cache_key(job), result)
+        except OSError as e:
+            print(f"WARNING: could not cache result: {e}")
+    return result
+
+# --- 4. ASYNC JOBS ---
+# With async=1 the upload returns a job id right away; the tool runs on a
+# bounded worker pool and the client polls /api/jobs/<id>.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_QUEUE_LIMIT = int(os.environ.get('JOB_QUEUE_LIMIT', 32))
+JOB_TTL = int(os.environ.get('JOB_TTL', 3600))
+
+JOBS = {}  # job_id -> {'status', 'slug', 'session_id', 'created', 'started', 'finished', 'result', 'error', 'progress'}
+PROGRESS_INTERVAL = float(os.environ.get('PROGRESS_INTERVAL', 0.25))  # seconds between updates per job
+
+class ProgressReporter:
+    # job['progress'] for async jobs. Updates are {'done', 'total', 'unit',
+    # 'bytes'} and travel over a queue, which is a multiprocessing Manager
+    # queue when one can be started, so handlers running in the process
+    # pool can report too. At most one update per PROGRESS_INTERVAL is sent,
+    # apart from the final one.
+    def __init__(self, job_id, updates):
+        self.job_id, self.updates = job_id, updates
+        self.sent = 0.0
+
+    def __call__(self, done, total, bytes_written=0, unit='pages'):
+        now = time.monotonic()
+        if done < total and now - self.sent < PROGRESS_INTERVAL:
+            return
+        self.sent = now
+        update = {'done': done, 'total': total, 'unit': unit, 'bytes': bytes_written}
+        try:
+            self.updates.put((self.job_id, update))
+        except Exception as e:
+            print(f"WARNING: progress update for job {self.job_id} dropped: {e}")
+
+def _progress_listener(updates):
+    while True:
+        try:
+            job_id, update = updates.get()
+        except (OSError, EOFError):
+            return  # manager shut down with the interpreter
+        record = JOBS.get(job_id)
+        if record is not None:
+            record['progress'] = update
+
+def _progress_queue():
+    with _lock:
+        if 'progress' not in _pools:
+            try:
+                manager = multiprocessing.get_context('spawn').Manager()
+                updates = manager.Queue()
+            except (OSError, EOFError, NotImplementedError) as e:
+                print(f"WARNING: progress manager unavailable ({e}), reporting in-process only")
+                manager, updates = None, queue.SimpleQueue()
+            threading.Thread(target=_progress_listener, args=(updates,), daemon=True).start()
+            _pools['progress'] = (manager, updates)
+        return _pools['progress'][1]
+
+def result_payload(session_id, result):
+    payload = {k: v for k, v in result.items() if k != 'path'}
+    payload.update({
+        'success': True,
+        'download_url': f"/download/{session_id}/{os.path.basename(result['path'])}"
+    })
+    return payload
+
+def _run_job(job_id, job):
+    record = JOBS[job_id]
+    record.update(status='running', started=time.time())
+    try:
+        record['result'] = run_and_cache(job['slug'], job)
+        record['status'] = 'done'
+        SESSIONS.commit(record['session_id'])
+    except Exception as e:
+        print(f"ERROR: job {job_id}: {str(e)}")
+        record.update(status='error', error=str(e))
+        SESSIONS.remove(record['session_id'])
+    finally:
+        record['finished'] = time.time()
+
+def submit_job(session_id, job):
+    now = time.time()
+    with _lock:
+        for job_id in [j for j, r in JOBS.items() if r.get('finished') and now - r['finished'] > JOB_TTL]:
+            del JOBS[job_id]
+        pending = sum(1 for r in JOBS.values() if r['status'] in ('queued', 'running'))
+        if pending >= JOB_QUEUE_LIMIT:
+            return None
+        if 'jobs' not in _pools:
+            _pools['jobs'] = ThreadPoolExecutor(max_workers=JOB_WORKERS)
+        job_id = uuid.uuid4().hex
+        JOBS[job_id] = {'status': 'queued', 'slug': job['slug'], 'session_id': session_id, 'created': now}
+    updates = _progress_queue()
+    # The in-process fallback queue can't be pickled, so jobs that are sent
+    # to the process pool go without progress reports then.
+    if not isinstance(updates, queue.SimpleQueue) or execution_mode(HANDLERS[job['slug']]) != 'process':
+        job['progress'] = ProgressReporter(job_id, updates)
+    _pools['jobs'].submit(_run_job, job_id, job)
+    return job_id
+
+def job_status(job_id, record):
+    status = {'job_id': job_id, 'status': record['status'], 'slug': record['slug']}
+    if record['status'] == 'queued':
+        # submit_job adds and drops records under _lock
+        with _lock:
+            status['position'] = sum(1 for r in JOBS.values()
+                                     if r['status'] == 'queued' and r['created'] < record['created'])
+    if record.get('started'):
+        status['elapsed'] = round((record.get('finished') or time.time()) - record['started'], 2)
+    if record.get('progress'):
+        status['progress'] = record['progress']
+    if record['status'] == 'done':
+        status.update(result_payload(record['session_id'], record['result']))
+        status['result_url'] = f"/api/jobs/{job_id}/result"
+    elif record['status'] == 'error':
+        status['error'] = record['error']
+    return status
 
 # --- PROCESS API ---
 @app.route('/api/process/<slug>', methods=['POST'])
 def process_file(slug):
+    if slug not in TOOLS:
+        return jsonify({'error': 'Unknown tool'}), 404
     if 'files[]' not in request.files:
         return jsonify({'error': 'No files uploaded'}), 400
     
     files = request.files.getlist('files[]')
-    password = request.form.get('password', '1234')
 
-    session_id = str(uuid.uuid4())
-    session_folder = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
-    os.makedirs(session_folder, exist_ok=True)
-    
-    input_paths = []
+    session_id = SESSIONS.create()
+    session_folder = SESSIONS.folder(session_id)
     
     try:
-        for file in files:
-            if file.filename:
-                safe_name = secure_filename(file.filename)
-                path = os.path.join(session_folder, safe_name)
-                file.save(path)
-                input_paths.append(path)
-
-        if not input_paths: return jsonify({'error': 'No valid files'}), 400
-
-        out_name = f"processed_{uuid.uuid4().hex[:6]}"
-        out_path = os.path.join(session_folder, f"{out_name}.pdf")
-        dl_ext = ".pdf"
-
-        # LOGIC
-        if slug == 'merge-pdf':
-            merger = PdfWriter()
-            for p in input_paths: merger.append(p)
-            merger.write(out_path)
-            merger.close()
-            
-        elif slug == 'split-pdf':
-            dl_ext = ".zip"
-            zip_target = os.path.join(session_folder, f"{out_name}.zip")
-            with zipfile.ZipFile(zip_target, 'w') as zf:
-                reader = PdfReader(input_paths[0])
-                for i, page in enumerate(reader.pages):
-                    writer = PdfWriter()
-                    writer.add_page(page)
-                    p_path = os.path.join(session_folder, f"page_{i+1}.pdf")
-                    writer.write(p_path)
-                    zf.write(p_path, f"page_{i+1}.pdf")
-                    
-        elif slug == 'compress-pdf':
-            reader = PdfReader(input_paths[0])
-            writer = PdfWriter()
-            writer.append_pages_from_reader(reader)
-            writer.add_metadata(reader.metadata)
-            with open(out_path, "wb") as f:
-                writer.write(f)
-
-        elif slug == 'jpg-to-pdf':
-            with open(out_path, "wb") as f:
-                f.write(img2pdf.convert(input_paths))
-
-        elif slug == 'word-to-pdf':
-            docx_to_pdf_content(input_paths[0], out_path)
-
-        elif slug == 'excel-to-pdf':
-            # Use OpenPyXL (Lighter than Pandas)
-            wb = load_workbook(input_paths[0], data_only=True)
-            ws = wb.active
-            
-            # Build Simple HTML
-            html_content = """
-            <html><body><h2>Excel Data</h2>
-            <table border="1" style="border-collapse: collapse; width: 100%;">
-            """
-            for row in ws.iter_rows(values_only=True):
-                html_content += "<tr>"
-                for cell in row:
-                    val = str(cell) if cell is not None else ""
-                    html_content += f"<td style='padding:4px;'>{val}</td>"
-                html_content += "</tr>"
-            html_content += "</table></body></html>"
-            
-            with open(out_path, "wb") as f:
-                pisa.CreatePDF(html_content, dest=f)
-
-        elif slug == 'html-to-pdf':
-            with open(input_paths[0], "r", encoding='utf-8', errors='ignore') as f:
-                pisa.CreatePDF(f.read(), dest=open(out_path, "wb"))
-
-        elif slug == 'pdf-to-word':
-            dl_ext = ".docx"
-            out_path = os.path.join(session_folder, f"{out_name}.docx")
-            cv = Pdf2DocxConverter(input_paths[0])
-            cv.convert(out_path, start=0, end=None)
-            cv.close()
-
-        elif slug == 'pdf-to-txt':
-            dl_ext = ".txt"
-            out_path = os.path.join(session_folder, f"{out_name}.txt")
-            reader = PdfReader(input_paths[0])
-            with open(out_path, "w", encoding="utf-8") as f:
-                for page in reader.pages:
-                    f.write(page.extract_text() + "\n\n")
-
-        elif slug == 'protect-pdf':
-            reader = PdfReader(input_paths[0])
-            writer = PdfWriter()
-            writer.append_pages_from_reader(reader)
-            writer.encrypt(password)
-            writer.write(out_path)
-
-        elif slug == 'unlock-pdf':
-            reader = PdfReader(input_paths[0])
-            if reader.is_encrypted:
-                reader.decrypt(password)
-            writer = PdfWriter()
-            writer.append_pages_from_reader(reader)
-            writer.write(out_path)
-            
-        else:
-            # Basic fallback copy
-            shutil.copy(input_paths[0], out_path)
+        # Converters read the upload streams directly; nothing is saved here.
+        inputs = [UploadInput.from_storage(file, session_folder) for file in files if file.filename]
+
+        if not inputs:
+            SESSIONS.remove(session_id)
+            return jsonify({'error': 'No valid files'}), 400
+
+        # Optional integrity check: one hex SHA-256 per file, in upload order.
+        for item, expected in zip(inputs, request.form.getlist('sha256[]')):
+            if expected and expected.lower() != item.digest:
+                SESSIONS.remove(session_id)
+                return jsonify({'error': f"Checksum mismatch for {item.name}"}), 400
+
+        job = {
+            'slug': slug,
+            'inputs': inputs,
+            'folder': session_folder,
+            'out_name': f"processed_{uuid.uuid4().hex[:6]}",
+            'options': dict(request.form.to_dict(), password=request.form.get('password', '1234')),
+        }
+
+        # stream=1 sends the output in this response instead of a download_url,
+        # so nothing has to stay on this instance for a second request.
+        result = cached_result(job)
+
+        if request.form.get('stream') == '1':
+            if result is None and HANDLERS[slug]['streaming']:
+                filename = f"{job['out_name']}{HANDLERS[slug]['ext']}"
+                response = Response(stream_with_context(start_stream(slug, job)), mimetype=HANDLERS[slug]['mimetype'],
+                                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+                response.call_on_close(lambda: SESSIONS.remove(session_id))
+                return response
+            if result is None:
+                result = run_and_cache(slug, job)
+            response = send_session_file(session_id, result['path'])
+            if 'stats' in result:
+                response.headers['X-Tool-Stats'] = json.dumps(result['stats'])
+            return response
+
+        if result is None and request.form.get('async') == '1':
+            for item in inputs:
+                item.detach()
+            job_id = submit_job(session_id, job)
+            if job_id is None:
+                SESSIONS.remove(session_id)
+                return jsonify({'error': 'Server busy, try again shortly'}), 503
+            return jsonify({'success': True, 'job_id': job_id, 'status_url': f"/api/jobs/{job_id}",
+                            'events_url': f"/api/jobs/{job_id}/events"}), 202
 
-        final_file = f"{out_name}{dl_ext}"
-        return jsonify({
-            'success': True,
-            'download_url': f"/download/{session_id}/{final_file}"
-        })
+        if result is None:
+            result = run_and_cache(slug, job)
+        SESSIONS.commit(session_id)
+        return jsonify(result_payload(session_id, result))
 
+    except ValueError as e:
+        SESSIONS.remove(session_id)
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"ERROR: {str(e)}")
+        SESSIONS.remove(session_id)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>')
+def job_view(job_id):
+    record = JOBS.get(job_id)
+    if record is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job_status(job_id, record))
+
+JOB_EVENTS_POLL = 0.25     # seconds between checks of the job record
+JOB_EVENTS_KEEPALIVE = 15  # seconds of silence before a comment line
+
+@app.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    # Server-Sent Events: a 'progress' event whenever the status or the
+    # progress changes, then one 'done' or 'error' event with the same body
+    # as /api/jobs/<id>, after which the stream ends.
+    if job_id not in JOBS:
+        return jsonify({'error': 'Unknown job'}), 404
+
+    def events():
+        last, quiet = None, 0.0
+        while True:
+            record = JOBS.get(job_id)
+            if record is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Unknown job'})}\n\n"
+                return
+            status = job_status(job_id, record)
+            if record['status'] in ('done', 'error'):
+                yield f"event: {record['status']}\ndata: {json.dumps(status)}\n\n"
+                return
+            current = (record['status'], record.get('progress'))
+            if current != last:
+                last, quiet = current, 0.0
+                yield f"event: progress\ndata: {json.dumps(status)}\n\n"
+            elif quiet >= JOB_EVENTS_KEEPALIVE:
+                quiet = 0.0
+                yield ": keepalive\n\n"
+            time.sleep(JOB_EVENTS_POLL)
+            quiet += JOB_EVENTS_POLL
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/jobs/<job_id>/result')
+def job_result(job_id):
+    record = JOBS.get(job_id)
+    if record is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if record['status'] == 'error':
+        return jsonify({'error': record['error']}), 500
+    if record['status'] != 'done':
+        return jsonify({'error': 'Job not finished', 'status': record['status']}), 409
+    return send_session_file(record['session_id'], record['result']['path'])
+
+@app.route('/api/tool-stats')
+def tool_stats():
+    return jsonify(TOOL_STATS)
+
+@app.route('/api/import-timings')
+def import_timings():
+    return jsonify({'modules': IMPORT_TIMINGS, 'tools': TOOL_IMPORT_TIMINGS})
+
+@app.route('/api/cache')
+def cache_stats():
+    return jsonify(RESULT_CACHE.stats() if RESULT_CACHE is not None else {'enabled': False})
+
+@app.route('/api/sessions')
+def session_stats():
+    return jsonify(SESSIONS.stats())
+
+def send_session_file(session_id, path):
+    if not os.path.isfile(path):
+        return jsonify({'error': 'This file has expired, please process it again'}), 410
+    response = send_file(path, as_attachment=True)
+    # Passthrough responses skip their close callbacks, so iterate normally.
+    response.direct_passthrough = False
+    response.call_on_close(lambda: SESSIONS.remove(session_id))
+    return response
+
 @app.route('/download/<session_id>/<filename>')
 def download(session_id, filename):
-    folder = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
-    return send_file(os.path.join(folder, filename), as_attachment=True)
+    try:
+        folder = SESSIONS.folder(session_id)
+    except ValueError:
+        return render_template('404.html'), 404
+    return send_session_file(session_id, os.path.join(folder, secure_filename(filename)))
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
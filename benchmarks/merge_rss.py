@@ -0,0 +1,84 @@
+"""Peak RSS of merge-pdf against the number of inputs, for both merge modes.
+
+    python benchmarks/merge_rss.py [--inputs 5,10,20,40] [--pages 4]
+
+Every measurement runs in a fresh interpreter, so ru_maxrss is the peak of
+that one merge. Inputs are synthetic PDFs with one noise image per page,
+which keeps every page's objects unique across inputs.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_inputs(folder, count, pages):
+    import img2pdf
+    from PIL import Image
+    paths = []
+    for i in range(count):
+        images = []
+        for p in range(pages):
+            img_path = os.path.join(folder, f"in_{i}_{p}.jpg")
+            Image.effect_noise((1200, 900), 64 + i % 32).convert('RGB').save(img_path, quality=85)
+            images.append(img_path)
+        path = os.path.join(folder, f"in_{i}.pdf")
+        with open(path, 'wb') as f:
+            f.write(img2pdf.convert(images))
+        paths.append(path)
+    return paths
+
+
+def run_merge(mode, folder, count):
+    import app
+    # Keep the size threshold from switching the standard run to streaming.
+    app.MERGE_STREAM_BYTES = float('inf')
+    job = {
+        'slug': 'merge-pdf',
+        'inputs': [app.UploadInput(f"in_{i}.pdf", folder, path=os.path.join(folder, f"in_{i}.pdf"))
+                   for i in range(count)],
+        'folder': folder,
+        'out_name': f"merged_{mode}_{count}",
+        'options': {'low_memory': '1' if mode == 'stream' else '0'},
+    }
+    start = time.perf_counter()
+    app.merge_pdf(job)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak *= 1024  # Linux reports KiB
+    print(f"{peak} {elapsed:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--inputs', default='5,10,20,40')
+    parser.add_argument('--pages', type=int, default=4)
+    parser.add_argument('--run', nargs=3, metavar=('MODE', 'FOLDER', 'COUNT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_merge(args.run[0], args.run[1], int(args.run[2]))
+        return
+
+    counts = [int(n) for n in args.inputs.split(',')]
+    with tempfile.TemporaryDirectory() as folder:
+        paths = make_inputs(folder, max(counts), args.pages)
+        print(f"{'inputs':>6} {'input MB':>9} {'mode':>8} {'peak RSS MB':>12} {'seconds':>8}")
+        for count in counts:
+            size = sum(os.path.getsize(p) for p in paths[:count]) / 2**20
+            for mode in ('standard', 'stream'):
+                out = subprocess.run([sys.executable, __file__, '--run', mode, folder, str(count)],
+                                     check=True, capture_output=True, text=True).stdout.split()
+                peak, seconds = int(out[-2]), float(out[-1])
+                print(f"{count:>6} {size:>9.1f} {mode:>8} {peak / 2**20:>12.1f} {seconds:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -66,6 +66,58 @@ document.addEventListener("DOMContentLoaded", () => {
         const downloadLink = document.getElementById('downloadLink');
         const convertBtn = document.getElementById('convertBtn');
 
+        async function readResult(res) {
+            // Tools reply with the file itself (stream=1) or with JSON (errors, async jobs)
+            const isJson = (res.headers.get('Content-Type') || '').includes('application/json');
+            if (!res.ok) {
+                // Tool errors are JSON; 413s, server errors and proxy pages are HTML
+                const body = isJson ? await res.json().catch(() => ({})) : {};
+                if (body.error) return { error: body.error };
+                return { error: res.status === 413 ? 'File too large' : `Request failed (${res.status})` };
+            }
+            if (isJson) return res.json();
+            const match = /filename="?([^";]+)"?/.exec(res.headers.get('Content-Disposition') || '');
+            const blob = await res.blob();
+            return { success: true, download_url: URL.createObjectURL(blob), filename: match ? match[1] : 'download' };
+        }
+
+        async function pollJob(statusUrl) {
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 1500));
+                const res = await fetch(statusUrl);
+                const job = await res.json();
+                showProgress(job);
+                if (job.status === 'done') return job;
+                if (job.status === 'error' || !res.ok) return { error: job.error || 'Job failed' };
+            }
+        }
+
+        function showProgress(job) {
+            // {done, total, unit, bytes} from the job's progress events
+            const p = job.progress;
+            if (!p || !p.total) return;
+            document.getElementById('progress').classList.remove('hidden');
+            document.getElementById('progressBar').style.width = `${Math.round(100 * p.done / p.total)}%`;
+            const size = p.bytes ? ` \u00b7 ${(p.bytes / 1024 / 1024).toFixed(2)} MB written` : '';
+            document.getElementById('progressText').textContent = `${p.done} / ${p.total} ${p.unit}${size}`;
+        }
+
+        function watchJob(job) {
+            // Server-Sent Events when the browser has them, polling otherwise
+            if (!window.EventSource || !job.events_url) return pollJob(job.status_url);
+            return new Promise(resolve => {
+                const events = new EventSource(job.events_url);
+                events.addEventListener('progress', e => showProgress(JSON.parse(e.data)));
+                events.addEventListener('done', e => { events.close(); resolve(JSON.parse(e.data)); });
+                events.addEventListener('error', e => {
+                    events.close();
+                    // A server 'error' event carries the job's error; a dropped connection does not
+                    if (e.data) resolve({ error: JSON.parse(e.data).error || 'Job failed' });
+                    else resolve(pollJob(job.status_url));
+                });
+            });
+        }
+
         // Update File List UI
         fileInput.addEventListener('change', (e) => {
             fileList.innerHTML = '';
@@ -92,6 +144,7 @@ document.addEventListener("DOMContentLoaded", () => {
             loader.classList.remove('hidden');
 
             const formData = new FormData(form);
+            if (!formData.has('async')) formData.append('stream', '1');
 
             try {
                 const response = await fetch(`/api/process/${toolSlug}`, {
@@ -99,7 +152,10 @@ document.addEventListener("DOMContentLoaded", () => {
                     body: formData
                 });
                 
-                const data = await response.json();
+                let data = await readResult(response);
+
+                // Long conversions come back as a job; follow it until it finishes
+                if (data.job_id) data = await watchJob(data);
 
                 loader.classList.add('hidden');
                 
@@ -107,6 +163,7 @@ document.addEventListener("DOMContentLoaded", () => {
                     form.classList.add('hidden');
                     result.classList.remove('hidden');
                     downloadLink.href = data.download_url;
+                    if (data.filename) downloadLink.download = data.filename;
                     
                     // Simple confetti effect for success
                     gsap.from(result, {scale: 0.8, opacity: 0, ease: "elastic.out(1, 0.3)", duration: 1});
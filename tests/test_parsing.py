@@ -0,0 +1,118 @@
+"""Parsers of user-supplied page selections, split ranges and merge specs.
+
+    python -m pytest -q tests
+"""
+import io
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+@pytest.mark.parametrize('expr, expected', [
+    ('1-3,5-', [[0, 1, 2], [4, 5, 6]]),
+    ('2', [[1]]),
+    ('-2, 7', [[0, 1], [6]]),
+    ('1-2,,3', [[0, 1], [2]]),
+    ('1-3,2-4', [[0, 1, 2], [1, 2, 3]]),
+])
+def test_parse_page_ranges(expr, expected):
+    assert app.parse_page_ranges(expr, 7) == expected
+
+
+@pytest.mark.parametrize('expr, message', [
+    ('3-1', 'Invalid page range'),
+    ('a-2', 'Invalid page range'),
+    ('0', 'outside 1-7'),
+    ('6-8', 'outside 1-7'),
+    (',', 'No pages selected'),
+])
+def test_parse_page_ranges_rejects(expr, message):
+    with pytest.raises(ValueError, match=message):
+        app.parse_page_ranges(expr, 7)
+
+
+@pytest.mark.parametrize('expr, expected', [
+    ('odd', [0, 2, 4, 6]),
+    ('even', [1, 3, 5]),
+    ('last', [6]),
+    ('last-3', [4, 5, 6]),
+    ('1-2, LAST', [0, 1, 6]),
+    ('odd,1-2', [0, 1, 2, 4, 6]),
+    ('3,3,2', [1, 2]),
+])
+def test_parse_page_selection(expr, expected):
+    assert app.parse_page_selection(expr, 7) == expected
+
+
+@pytest.mark.parametrize('expr, message', [
+    ('last-0', 'outside 1-7'),
+    ('last-8', 'outside 1-7'),
+    ('last-x', 'Invalid page selection'),
+    ('8', 'outside 1-7'),
+    ('', 'No pages selected'),
+])
+def test_parse_page_selection_rejects(expr, message):
+    with pytest.raises(ValueError, match=message):
+        app.parse_page_selection(expr, 7)
+
+
+def test_parse_page_selection_even_of_one_page():
+    with pytest.raises(ValueError, match='No pages selected'):
+        app.parse_page_selection('even', 1)
+
+
+@pytest.mark.parametrize('options, expected', [
+    ({}, [[0], [1], [2], [3], [4]]),
+    ({'chunk_size': '2'}, [[0, 1], [2, 3], [4]]),
+    ({'chunk_size': '0'}, [[0], [1], [2], [3], [4]]),
+    ({'ranges': '1-2,4-', 'chunk_size': '3'}, [[0, 1], [3, 4]]),
+])
+def test_split_groups(options, expected):
+    assert app.split_groups(options, 5) == expected
+
+
+@pytest.mark.parametrize('ranges, message', [
+    ('1-2,1-2', 'Page range 1-2 is listed more than once'),
+    ('3,2,3', 'Page 3 is listed more than once'),
+])
+def test_split_groups_rejects_repeats(ranges, message):
+    with pytest.raises(ValueError, match=message):
+        app.split_groups({'ranges': ranges}, 5)
+
+
+def merge_job(spec, count=2):
+    inputs = [app.UploadInput(f"in_{i}.pdf", '.', stream=io.BytesIO(b'')) for i in range(count)]
+    options = {} if spec is None else {'spec': spec if isinstance(spec, str) else json.dumps(spec)}
+    return {'inputs': inputs, 'options': options}
+
+
+def test_merge_plan_defaults_to_upload_order():
+    job = merge_job(None)
+    assert app.merge_plan(job) == [(job['inputs'][0], None, None), (job['inputs'][1], None, None)]
+
+
+def test_merge_plan_spec():
+    job = merge_job([{'file': 1, 'pages': '1-3', 'bookmark': 'Intro'}, {'file': 0}, {'file': 1, 'pages': 'last'}])
+    first, second = job['inputs']
+    assert app.merge_plan(job) == [(second, '1-3', 'Intro'), (first, None, None), (second, 'last', None)]
+
+
+@pytest.mark.parametrize('spec, message', [
+    ('[{"file": 0', 'not valid JSON'),
+    ([], 'non-empty JSON list'),
+    ({'file': 0}, 'non-empty JSON list'),
+    ([{'file': 2}], 'file index between 0 and 1'),
+    ([{'file': -1}], 'file index between 0 and 1'),
+    ([{'file': '0'}], 'file index between 0 and 1'),
+    (['0'], 'file index between 0 and 1'),
+    ([{'file': 0, 'pages': [1, 2]}], 'must be strings'),
+    ([{'file': 0, 'bookmark': 3}], 'must be strings'),
+])
+def test_merge_plan_rejects(spec, message):
+    with pytest.raises(ValueError, match=message):
+        app.merge_plan(merge_job(spec))